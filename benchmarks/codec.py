@@ -0,0 +1,80 @@
+"""
+Сравнение кодеков кеша на документах фильмов из es_index/movies.3.data.json:
+сколько места займут все фильмы в Redis и сколько стоит кодирование и
+декодирование одного документа (вместе с моделью Film, как в сервисе).
+Сжатие zstd и lz4 пропускается, если не установлены zstandard и lz4.
+
+    python benchmarks/codec.py
+    python benchmarks/codec.py --threshold 512 --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+from itertools import product
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / 'src'), str(ROOT)]
+
+for name, value in {'PROJECT_NAME': 'benchmark',
+                    'REDIS_HOST': 'localhost', 'REDIS_PORT': '6379',
+                    'ELASTIC_HOST': 'localhost', 'ELASTIC_PORT': '9200',
+                    'HOST': '127.0.0.1', 'PORT': '8000'}.items():
+    os.environ.setdefault(name, value)
+
+from benchmarks.fake_elastic import load_indices  # noqa: E402
+from models.films import Film  # noqa: E402
+from services.codec import COMPRESSORS, SERIALIZERS, Codec  # noqa: E402
+
+
+def measure(codec: Codec, films: list[Film], repeat: int) -> dict:
+    values = [film.dict() for film in films]
+    entries = [codec.dumps(value) for value in values]
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            codec.dumps(value)
+    encode = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for entry in entries:
+            Film(**codec.loads(entry))
+    decode = time.perf_counter() - started
+
+    count = len(films) * repeat
+    return {'bytes': sum(map(len, entries)),
+            'encode_us': encode / count * 1e6,
+            'decode_us': decode / count * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threshold', type=int, default=1,
+                        help='сжимать записи от этого размера, 0 - никогда')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    movies = load_indices(ROOT / 'es_index')['movies']
+    films = [Film(**source) for source in movies.values()]
+    # Так фильмы лежали в кеше до кодеков: entity.json() без заголовка
+    legacy = sum(len(film.json()) for film in films)
+    print(f'{len(films)} films, entity.json(): {legacy} bytes')
+    print(f'{"codec":<18}{"bytes":>10}{"ratio":>8}'
+          f'{"encode, us":>12}{"decode, us":>12}')
+
+    for serializer, compression in product(SERIALIZERS, COMPRESSORS):
+        if not (SERIALIZERS[serializer][3] and COMPRESSORS[compression][3]):
+            print(f'{serializer}+{compression:<10} not installed')
+            continue
+        codec = Codec(serializer, compression, args.threshold)
+        res = measure(codec, films, args.repeat)
+        print(f'{serializer + "+" + compression:<18}{res["bytes"]:>10}'
+              f'{res["bytes"] / legacy:>8.2f}'
+              f'{res["encode_us"]:>12.1f}{res["decode_us"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
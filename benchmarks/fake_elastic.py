@@ -0,0 +1,393 @@
+"""
+Elasticsearch в памяти процесса для бенчмарков: индексы загружаются из
+дампов es_index/*.3.data.json. Поддерживается только то подмножество API и
+Query DSL, которым пользуется сервис.
+"""
+import asyncio
+import contextvars
+import json
+import re
+import uuid
+from functools import lru_cache
+from pathlib import Path
+
+from elasticsearch import NotFoundError
+
+TOKEN = re.compile(r'\w+', re.U)
+
+# Счётчик обращений к ES в рамках текущего запроса к API
+es_calls: contextvars.ContextVar[list | None] = \
+    contextvars.ContextVar('es_calls', default=None)
+
+
+def load_indices(es_index_dir: Path) -> dict[str, dict[str, dict]]:
+    indices = {}
+    for path in sorted(es_index_dir.glob('*.3.data.json')):
+        index = path.name.split('.')[0]
+        with open(path, encoding='utf-8') as f:
+            docs = (json.loads(line) for line in f if line.strip())
+            indices[index] = {doc['_id']: doc['_source'] for doc in docs}
+    return indices
+
+
+@lru_cache(maxsize=None)
+def _tokens(value) -> tuple[str, ...]:
+    return tuple(token.lower() for token in TOKEN.findall(str(value)))
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _values(doc: dict, field: str) -> list:
+    if '.' not in field:
+        return _as_list(doc.get(field))
+    values = [doc]
+    for part in field.split('.'):
+        values = [item
+                  for value in values if isinstance(value, dict)
+                  for item in _as_list(value.get(part))]
+    if not values and '.' in field:
+        # Мультиполя вроде title.raw хранятся в самом поле
+        return _values(doc, field.rsplit('.', 1)[0])
+    return values
+
+
+def _strip_path(query: dict, path: str) -> dict:
+    return json.loads(json.dumps(query).replace(f'"{path}.', '"'))
+
+
+def _is_keyword(field: str) -> bool:
+    return field == 'id' or field.endswith('.id') or field.endswith('.raw')
+
+
+def compile_query(query: dict | None):
+    """Превращает запрос в функцию doc -> score (0 - документ не подходит)."""
+    if not query:
+        return lambda doc: 1.0
+    (kind, body), = query.items()
+
+    if kind == 'match_all':
+        return lambda doc: 1.0
+    if kind == 'bool':
+        must = [compile_query(clause) for clause in
+                _as_list(body.get('must')) + _as_list(body.get('filter'))]
+        must_not = [compile_query(clause)
+                    for clause in _as_list(body.get('must_not'))]
+        should = [compile_query(clause)
+                  for clause in _as_list(body.get('should'))]
+
+        def bool_query(doc):
+            total = 0.0
+            for clause in must:
+                res = clause(doc)
+                if not res:
+                    return 0
+                total += res
+            if any(clause(doc) for clause in must_not):
+                return 0
+            should_total = sum(clause(doc) for clause in should)
+            if should and not should_total and not must:
+                return 0
+            return total + should_total or 1.0
+        return bool_query
+    if kind == 'nested':
+        path = body['path']
+        inner = compile_query(_strip_path(body['query'], path))
+        return lambda doc: max((inner(item) for item in _values(doc, path)),
+                               default=0)
+    if kind in ('match', 'match_bool_prefix', 'match_phrase_prefix'):
+        (field, value), = body.items()
+        if isinstance(value, dict):
+            value = value['query']
+        if _is_keyword(field):
+            value = str(value)
+            return lambda doc: 1.0 if value in map(str, _values(doc, field)) \
+                else 0
+        query_tokens = _tokens(value)
+
+        def doc_tokens(doc):
+            return {token for item in _values(doc, field)
+                    for token in _tokens(item)}
+
+        if kind == 'match' and not field.endswith('.suggest'):
+            return lambda doc: float(len(set(query_tokens) & doc_tokens(doc)))
+
+        # Поиск по мере набора: последний токен ищется как префикс
+        *full, last = query_tokens or ('',)
+
+        def prefix_query(doc):
+            tokens = doc_tokens(doc)
+            if all(token in tokens for token in full) and \
+                    any(token.startswith(last) for token in tokens):
+                return float(len(query_tokens))
+            return 0
+        return prefix_query
+    if kind in ('term', 'terms'):
+        (field, values), = body.items()
+        if kind == 'term':
+            values = [values['value'] if isinstance(values, dict) else values]
+        values = set(values)
+        return lambda doc: 1.0 if values & set(_values(doc, field)) else 0
+    if kind == 'ids':
+        values = set(body['values'])
+        return lambda doc: 1.0 if doc.get('id') in values else 0
+    if kind == 'range':
+        (field, bounds), = body.items()
+        checks = {'gt': lambda a, b: a > b, 'gte': lambda a, b: a >= b,
+                  'lt': lambda a, b: a < b, 'lte': lambda a, b: a <= b}
+        bounds = [(checks[op], bound) for op, bound in bounds.items()
+                  if op in checks]
+        return lambda doc: 1.0 if any(
+            all(check(value, bound) for check, bound in bounds)
+            for value in _values(doc, field) if value is not None) else 0
+    if kind == 'multi_match':
+        fields = [compile_query({'match': {field.split('^')[0]:
+                                           body['query']}})
+                  for field in body['fields']]
+        return lambda doc: max(field(doc) for field in fields)
+    raise ValueError(f'Unsupported query: {kind}')
+
+
+def _project(source: dict, includes) -> dict:
+    if not includes or includes is True:
+        return source
+    if isinstance(includes, str):
+        includes = includes.split(',')
+    res = {}
+    for field in includes:
+        head, _, rest = field.partition('.')
+        if head not in source:
+            continue
+        value = source[head]
+        if not rest:
+            res[head] = value
+        elif isinstance(value, list):
+            items = res.setdefault(head, [{} for _ in value])
+            for item, original in zip(items, value):
+                if rest in original:
+                    item[rest] = original[rest]
+        elif isinstance(value, dict):
+            res.setdefault(head, {})[rest] = value.get(rest)
+    return res
+
+
+def _aggregate(aggs: dict, docs: list[dict]) -> dict:
+    res = {}
+    for name, agg in aggs.items():
+        sub = agg.get('aggs') or agg.get('aggregations') or {}
+        if 'nested' in agg:
+            path = agg['nested']['path']
+            items = [item for doc in docs for item in _values(doc, path)]
+            res[name] = {'doc_count': len(items),
+                         **_aggregate({k: _strip_path(v, path)
+                                       for k, v in sub.items()}, items)}
+        elif 'terms' in agg:
+            field = agg['terms']['field']
+            groups: dict = {}
+            for doc in docs:
+                for value in set(_values(doc, field)):
+                    groups.setdefault(value, []).append(doc)
+            ordered = sorted(groups.items(),
+                             key=lambda kv: (-len(kv[1]), str(kv[0])))
+            res[name] = {'buckets': [
+                {'key': key, 'doc_count': len(group),
+                 **_aggregate(sub, group)}
+                for key, group in ordered[:agg['terms'].get('size', 10)]]}
+        elif 'histogram' in agg:
+            field = agg['histogram']['field']
+            interval = agg['histogram']['interval']
+            groups = {}
+            for doc in docs:
+                for value in _values(doc, field)[:1]:
+                    key = (value // interval) * interval
+                    groups.setdefault(key, []).append(doc)
+            res[name] = {'buckets': [
+                {'key': key, 'doc_count': len(group),
+                 **_aggregate(sub, group)}
+                for key, group in sorted(groups.items())]}
+        elif 'top_hits' in agg:
+            size = agg['top_hits'].get('size', 3)
+            includes = agg['top_hits'].get('_source')
+            res[name] = {'hits': {'hits': [
+                {'_source': _project(doc, includes)} for doc in docs[:size]]}}
+        else:
+            raise ValueError(f'Unsupported aggregation: {agg}')
+    return res
+
+
+class _Reversed:
+    # Обёртка для сортировки строк по убыванию
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class FakeElastic:
+    def __init__(self, indices: dict[str, dict[str, dict]],
+                 latency: float = 0):
+        self.indices = indices
+        # Имитация сетевой задержки до ES, в секундах
+        self.latency = latency
+        self.pits: dict[str, str] = {}
+        # Данные не меняются, поэтому ответы на одинаковые запросы
+        # переиспользуются: бенчмарк должен мерить сервис, а не эту заглушку
+        self._responses: dict[str, dict] = {}
+
+    async def _call(self):
+        calls = es_calls.get()
+        if calls is not None:
+            calls.append(1)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _index(self, index: str) -> dict[str, dict]:
+        if index not in self.indices:
+            raise NotFoundError(404, 'index_not_found_exception', {})
+        return self.indices[index]
+
+    async def close(self):
+        pass
+
+    async def ping(self, **kwargs) -> bool:
+        return True
+
+    async def get(self, index, id, **kwargs):
+        await self._call()
+        docs = self._index(index)
+        if id not in docs:
+            raise NotFoundError(404, 'not_found', {})
+        includes = kwargs.get('_source_includes') or kwargs.get('_source')
+        return {'_index': index, '_id': id, 'found': True,
+                '_source': _project(docs[id], includes)}
+
+    async def mget(self, body, index=None, **kwargs):
+        await self._call()
+        docs = self._index(index)
+        includes = kwargs.get('_source_includes') or kwargs.get('_source')
+        return {'docs': [
+            {'_index': index, '_id': _id, 'found': True,
+             '_source': _project(docs[_id], includes)}
+            if _id in docs else {'_index': index, '_id': _id, 'found': False}
+            for _id in body['ids']]}
+
+    async def search(self, body=None, index=None, **kwargs):
+        await self._call()
+        return self._search(index, **{**(body or {}), **kwargs})
+
+    async def msearch(self, body, index=None, **kwargs):
+        await self._call()
+        responses = []
+        for header, request in zip(body[::2], body[1::2]):
+            try:
+                responses.append(
+                    self._search(header.get('index', index), **request))
+            except NotFoundError as e:
+                responses.append({'error': str(e), 'status': 404})
+        return {'responses': responses}
+
+    async def count(self, body=None, index=None, query=None, **kwargs):
+        await self._call()
+        score = compile_query(query or (body or {}).get('query'))
+        docs = self._index(index)
+        return {'count': sum(1 for doc in docs.values() if score(doc))}
+
+    async def open_point_in_time(self, index, **kwargs):
+        await self._call()
+        self._index(index)
+        pit = uuid.uuid4().hex
+        self.pits[pit] = index
+        return {'id': pit}
+
+    async def close_point_in_time(self, body=None, **kwargs):
+        await self._call()
+        if self.pits.pop(body['id'], None) is None:
+            raise NotFoundError(404, 'search_context_missing_exception', {})
+        return {'succeeded': True, 'num_freed': 1}
+
+    def _search(self, index=None, **kwargs):
+        key = json.dumps([index, kwargs], sort_keys=True, default=str)
+        if key not in self._responses:
+            self._responses[key] = self._execute_search(index, **kwargs)
+        return self._responses[key]
+
+    def _execute_search(self, index=None, query=None, size=10, sort=None,
+                        search_after=None, pit=None, aggs=None, _source=None,
+                        _source_includes=None, **kwargs):
+        offset = kwargs.get('from_', kwargs.get('from')) or 0
+        if pit:
+            if pit['id'] not in self.pits:
+                raise NotFoundError(404, 'search_context_missing_exception',
+                                    {})
+            index = self.pits[pit['id']]
+        docs = self._index(index)
+
+        score = compile_query(query)
+        hits = [{'_index': index, '_id': _id, '_score': res, '_source': doc}
+                for _id, doc in docs.items() for res in [score(doc)]
+                if res]
+
+        sorting = []
+        for item in sort or ['_score']:
+            if isinstance(item, str):
+                sorting.append((item, 'desc' if item == '_score' else 'asc'))
+            else:
+                (field, order), = item.items()
+                sorting.append(
+                    (field, order['order'] if isinstance(order, dict)
+                     else order))
+
+        def sort_values(hit):
+            values = []
+            for field, _ in sorting:
+                if field == '_score':
+                    values.append(hit['_score'])
+                elif field in ('_id', '_shard_doc'):
+                    values.append(hit['_id'])
+                else:
+                    values.append(next(iter(_values(hit['_source'], field)),
+                                       None))
+            return values
+
+        def sort_key(values):
+            key = []
+            for (field, order), value in zip(sorting, values):
+                # Документы без значения всегда в конце
+                if value is None:
+                    key.append((1, 0))
+                elif order == 'desc':
+                    key.append((0, -value if isinstance(value, (int, float))
+                                else _Reversed(value)))
+                else:
+                    key.append((0, value))
+            return key
+
+        for hit in hits:
+            hit['sort'] = sort_values(hit)
+        hits.sort(key=lambda hit: sort_key(hit['sort']))
+        total = len(hits)
+
+        if search_after is not None:
+            after = sort_key(search_after)
+            hits = [hit for hit in hits if sort_key(hit['sort']) > after]
+        if offset + size > 10000:
+            raise ValueError('Result window is too large')
+
+        includes = _source if _source not in (None, True) else _source_includes
+        page = [{**hit, '_source': _project(hit['_source'], includes)}
+                for hit in hits[offset:offset + size]]
+        res = {'hits': {'total': {'value': total, 'relation': 'eq'},
+                        'hits': page}}
+        if pit:
+            res['pit_id'] = pit['id']
+        if aggs:
+            res['aggregations'] = _aggregate(aggs, [hit['_source']
+                                                    for hit in hits])
+        return res
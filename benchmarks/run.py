@@ -0,0 +1,204 @@
+"""
+Нагрузочный бенчмарк API без внешних сервисов: main:app поднимается в
+процессе, Redis заменяется fakeredis, Elasticsearch - FakeElastic с данными
+из es_index. Смешанная нагрузка по фильмам, жанрам, персонам и поиску
+прогоняется через ASGI, по каждому эндпоинту считаются p50/p95/p99, RPS и
+доля запросов, обслуженных без обращения к ES.
+
+    python benchmarks/run.py --requests 5000 --concurrency 50
+    python benchmarks/run.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / 'src'), str(ROOT)]
+
+# Настройки сервиса обязательны, но в бенчмарке ни к чему не подключаемся
+for name, value in {'PROJECT_NAME': 'benchmark',
+                    'REDIS_HOST': 'localhost', 'REDIS_PORT': '6379',
+                    'ELASTIC_HOST': 'localhost', 'ELASTIC_PORT': '9200',
+                    'HOST': '127.0.0.1', 'PORT': '8000'}.items():
+    os.environ.setdefault(name, value)
+
+import fakeredis  # noqa: E402
+import httpx  # noqa: E402
+
+from benchmarks.fake_elastic import FakeElastic, es_calls, \
+    load_indices  # noqa: E402
+from db import elastic, redis  # noqa: E402
+import main  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def _skewed(rng: random.Random, items: list):
+    # Популярность по Ципфу: первые элементы запрашиваются намного чаще
+    return rng.choices(items, weights=[1 / (i + 1)
+                                       for i in range(len(items))])[0]
+
+
+def build_workload(indices: dict, count: int, seed: int) -> list[tuple]:
+    rng = random.Random(seed)
+    film_ids = list(indices['movies'])
+    genre_ids = list(indices['genres'])
+    person_ids = list(indices['persons'])
+    rng.shuffle(film_ids)
+    rng.shuffle(person_ids)
+    title_words = sorted({word for film in indices['movies'].values()
+                          for word in film['title'].split() if len(word) > 3})
+    name_words = sorted({word for person in indices['persons'].values()
+                         for word in person['full_name'].split()
+                         if len(word) > 3})
+
+    scenarios = [
+        (30, 'GET /api/v1/films/{film_id}',
+         lambda: ('GET', f'/api/v1/films/{_skewed(rng, film_ids)}', None)),
+        (20, 'GET /api/v1/films/',
+         lambda: ('GET', '/api/v1/films/', {
+             k: v for k, v in {
+                 'sort': rng.choice([None, 'imdb_rating', '-imdb_rating']),
+                 'genre': rng.choice([None, _skewed(rng, genre_ids)]),
+                 'page_number': _skewed(rng, [1, 2, 3]),
+                 'page_size': rng.choice([20, 50, 100])}.items() if v})),
+        (10, 'GET /api/v1/films/search',
+         lambda: ('GET', '/api/v1/films/search',
+                  {'query': _skewed(rng, title_words)})),
+        (5, 'GET /api/v1/genres/',
+         lambda: ('GET', '/api/v1/genres/', None)),
+        (5, 'GET /api/v1/genres/{genre_id}',
+         lambda: ('GET', f'/api/v1/genres/{rng.choice(genre_ids)}', None)),
+        (10, 'GET /api/v1/persons/{person_id}',
+         lambda: ('GET', f'/api/v1/persons/{_skewed(rng, person_ids)}',
+                  None)),
+        (5, 'GET /api/v1/persons/{person_id}/film',
+         lambda: ('GET', f'/api/v1/persons/{_skewed(rng, person_ids)}/film',
+                  None)),
+        (10, 'GET /api/v1/persons/search',
+         lambda: ('GET', '/api/v1/persons/search',
+                  {'query': _skewed(rng, name_words),
+                   'page_size': rng.choice([20, 100])})),
+        (5, 'POST /api/v1/films/batch',
+         lambda: ('POST', '/api/v1/films/batch',
+                  {'ids': [_skewed(rng, film_ids) for _ in range(20)]})),
+    ]
+
+    weights = [weight for weight, _, _ in scenarios]
+    workload = []
+    for _ in range(count):
+        _, label, make = rng.choices(scenarios, weights=weights)[0]
+        workload.append((label, *make()))
+    return workload
+
+
+async def run(workload: list[tuple], concurrency: int,
+              es_latency: float) -> dict:
+    redis.redis = fakeredis.FakeAsyncRedis()
+    elastic.es = FakeElastic(load_indices(ROOT / 'es_index'), es_latency)
+
+    latencies = defaultdict(list)
+    es_free = defaultdict(int)
+    errors = defaultdict(int)
+    queue = asyncio.Queue()
+    for item in workload:
+        queue.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url='http://benchmark') as client:
+        async def worker():
+            while not queue.empty():
+                label, method, path, data = queue.get_nowait()
+                calls = []
+                es_calls.set(calls)
+                started = time.perf_counter()
+                if method == 'GET':
+                    response = await client.get(path, params=data)
+                else:
+                    response = await client.post(path, json=data)
+                latencies[label].append(time.perf_counter() - started)
+                if not calls:
+                    es_free[label] += 1
+                if response.status_code >= 500:
+                    errors[label] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {label: _summary(values, elapsed, es_free[label], errors[label])
+            for label, values in sorted(latencies.items())}
+
+
+def _summary(values: list[float], elapsed: float, es_free: int,
+             errors: int) -> dict:
+    values = sorted(values)
+    res = {f'p{p}': values[min(len(values) - 1, len(values) * p // 100)]
+           * 1000 for p in PERCENTILES}
+    res.update({'count': len(values),
+                'rps': len(values) / elapsed,
+                'cache_hit_ratio': es_free / len(values),
+                'errors': errors})
+    return res
+
+
+def report(results: dict, baseline: dict = None):
+    header = f'{"endpoint":42} {"count":>6} {"rps":>8} ' + \
+             ' '.join(f'{f"p{p} ms":>9}' for p in PERCENTILES) + \
+             f' {"hit":>6} {"err":>4}'
+    print(header)
+    print('-' * len(header))
+    for label, res in results.items():
+        line = f'{label:42} {res["count"]:6d} {res["rps"]:8.1f} ' + \
+               ' '.join(f'{res[f"p{p}"]:9.2f}' for p in PERCENTILES) + \
+               f' {res["cache_hit_ratio"]:6.1%} {res["errors"]:4d}'
+        print(line)
+        if baseline and label in baseline:
+            base = baseline[label]
+            print(f'{"  vs baseline":42} {"":6} '
+                  f'{_delta(res["rps"], base["rps"]):>8} ' +
+                  ' '.join(f'{_delta(res[f"p{p}"], base[f"p{p}"]):>9}'
+                           for p in PERCENTILES))
+
+
+def _delta(value: float, base: float) -> str:
+    if not base:
+        return '-'
+    return f'{(value - base) / base:+.0%}'
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--es-latency', type=float, default=2,
+                        help='задержка ответа Elasticsearch, мс')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', type=Path)
+    parser.add_argument('--compare', type=Path)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    workload = build_workload(load_indices(ROOT / 'es_index'),
+                              args.requests, args.seed)
+    results = asyncio.run(run(workload, args.concurrency,
+                              args.es_latency / 1000))
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    report(results, baseline)
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main_cli()
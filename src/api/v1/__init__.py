@@ -1,7 +1,15 @@
+import base64
+import binascii
 from http import HTTPStatus
 
-from fastapi import HTTPException
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
 
+import core.config as conf
+from core import metrics
+from core.config import settings
+from services import cache_keys
 from src.models.films import Film
 
 
@@ -13,36 +21,136 @@ async def _details(_service, _id: str, index: str = None):
     return res
 
 
+async def _details_many(_service, ids: list[str], index: str = None):
+    res = await _service.get_many(ids, index)
+    if not res:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f'{ids} not found in {index}')
+    return res
+
+
 async def _list(_service,
                 index: str = None,
                 sort: str = None,
                 search: dict = None,
                 key: str = None,
                 page: int = None,
-                size: int = None):
-    res = await _service.get_list(index, sort, search, key, page, size)
+                size: int = None,
+                search_after: list = None,
+                pit: str = None):
+    res = await _service.get_list(index, sort, search, key, page, size,
+                                  search_after, pit)
     if not res:
+        # Пустая страница после полной последней: курсор ещё держит
+        # point-in-time, до _set_next_page_token дело не дойдёт
+        pit = getattr(res, 'pit_id', None) or pit
+        if pit:
+            await _service.close_pit(pit)
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=f'{index} not found')
     return res
 
 
-async def _get_cache_key(args_dict: dict = None,
-                         index: str = None) -> str:
-    if not args_dict:
-        args_dict = {}
-
-    key = ''
-    for k, v in args_dict.items():
-        if v:
-            key += f':{k}:{v}'
-
-    return f'index:{index}{key}' if key else f'index:{index}'
-
-
-async def _films_for_person(_service, person_id: str = None, key: str = None) \
-        -> list[Film]:
-    search = {
+def _encode_page_token(after: list, pit: str = None) -> str:
+    data = {'after': after, 'pit': pit} if pit else {'after': after}
+    return base64.urlsafe_b64encode(orjson.dumps(data)).decode()
+
+
+def _decode_page_token(token: str) -> tuple[list, str | None]:
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(token))
+        return data['after'], data.get('pit')
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'Invalid `{conf.PAGE_TOKEN_ALIAS}`')
+
+
+async def _page_cursor(_service, index: str, page_token: str = None) \
+        -> tuple[list | None, str | None]:
+    if not page_token:
+        return None, None
+
+    after, pit = _decode_page_token(page_token)
+    if not pit and settings.PAGINATION_USE_PIT:
+        pit = await _service.open_pit(index)
+    return after, pit
+
+
+async def _set_next_page_token(response: Response, _service, page,
+                               size: int = None):
+    # Неполная страница - последняя, курсор дальше не нужен
+    if page.after and len(page) >= size:
+        response.headers[conf.NEXT_PAGE_TOKEN_HEADER] = \
+            _encode_page_token(page.after, page.pit_id)
+    elif page.pit_id:
+        await _service.close_pit(page.pit_id)
+
+
+def _export_fields(fields: str = None,
+                   allowed: tuple[str, ...] = ()) -> list[str]:
+    # Проекция полей выгрузки; id есть всегда
+    if not fields:
+        return list(allowed)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'Unknown fields: {", ".join(unknown)}')
+    return list(dict.fromkeys(['id', *names]))
+
+
+async def _export(_service, index: str, fields: list[str]) \
+        -> StreamingResponse:
+    stream = _service.scan(index, fields, settings.EXPORT_BATCH_SIZE)
+    # Первую пачку запрашиваем до начала ответа: если ES недоступен,
+    # клиент получит 503, а не оборванный поток
+    first = await anext(stream, None)
+
+    async def ndjson():
+        # Следующая пачка запрашивается, только когда предыдущая ушла
+        # клиенту; при обрыве соединения point-in-time закрывается
+        try:
+            batch = first
+            while batch is not None:
+                yield b''.join(orjson.dumps(doc) + b'\n' for doc in batch)
+                batch = await anext(stream, None)
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(ndjson(),
+                             media_type='application/x-ndjson',
+                             # Без буферизации и кеширования в nginx
+                             headers={'Cache-Control': 'no-store',
+                                      'X-Accel-Buffering': 'no'})
+
+
+def _get_cache_key(_service, index: str, args_dict: dict = None) -> str:
+    # Ключ зависит от индекса, модели сервиса и набора параметров,
+    # но не от их порядка и пустых значений
+    return cache_keys.list_key(index, _service.model, args_dict)
+
+
+def _normalize_prefix(query: str) -> str:
+    # "  Star  WA" и "star wa" - одна и та же подсказка и один ключ кеша
+    return ' '.join(query.lower().split())
+
+
+async def _suggest(_service, index: str, field: str, query: str,
+                   size: int) -> list:
+    prefix = _normalize_prefix(query)
+    if not prefix:
+        return []
+    # Все слова запроса, последнее - как начало слова: поле .suggest
+    # проиндексировано edge n-gram'ами
+    search = {"match": {f"{field}.suggest": {"query": prefix,
+                                             "operator": "and"}}}
+    key = _get_cache_key(_service, index, {'suggest': prefix, 'size': size})
+    return await _service.get_list(index, search=search, key=key,
+                                   size=size) or []
+
+
+def _person_films_query(person_id: str = None) -> dict:
+    return {
         "bool": {
             "should": [
                 {"nested": {
@@ -78,7 +186,15 @@ async def _films_for_person(_service, person_id: str = None, key: str = None) \
         }
     }
 
-    return await _list(_service, index='movies', search=search, key=key)
+
+async def _films_for_persons(_service,
+                             person_ids: list[str] = None,
+                             keys: list[str] = None) -> dict[str, list[Film]]:
+    # Фильмы для целой страницы персон одним msearch-запросом
+    searches = [_person_films_query(person_id) for person_id in person_ids]
+    films = await _service.get_lists('movies', searches, keys)
+    return {person_id: person_films or []
+            for person_id, person_films in zip(person_ids, films)}
 
 
 def _films_to_list(person_id: str = None, films: list[Film] = None) \
@@ -101,3 +217,30 @@ def _films_to_list(person_id: str = None, films: list[Film] = None) \
         films_res.append(films_structure)
 
     return films_res
+
+
+async def _person_films(_service, persons: list = None) \
+        -> dict[str, list[dict]]:
+    # Фильмы с ролями материализованы в документе персоны
+    # (commands.person_films). В movies идём только за персонами,
+    # документы которых ещё не пересобраны
+    res = {person.id: person.films
+           for person in persons if person.films is not None}
+    rest = [person.id for person in persons if person.films is None]
+    if not rest:
+        return res
+
+    keys = [_get_cache_key(_service, 'movies', {'person_id': person_id})
+            for person_id in rest]
+    with metrics.timer('person_films', 'movies'):
+        films = await _films_for_persons(_service, rest, keys)
+        for person_id in rest:
+            res[person_id] = [{'id': film.id,
+                               'title': film.title,
+                               'imdb_rating': film.imdb_rating,
+                               'roles': roles['roles']}
+                              for film, roles in zip(
+                                  films[person_id],
+                                  _films_to_list(person_id,
+                                                 films[person_id]))]
+    return res
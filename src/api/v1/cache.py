@@ -0,0 +1,44 @@
+import core.config as conf
+
+import secrets
+from http import HTTPStatus
+from fastapi import APIRouter, Depends, Header, HTTPException
+from redis.asyncio import Redis
+
+from core.config import settings
+from db.redis import get_redis
+from models.model import InvalidationModel, Model
+from services.invalidation import invalidate
+
+router = APIRouter()
+
+
+class Invalidated(Model):
+    purged: int
+
+
+@router.post('/invalidate',
+             response_model=Invalidated,
+             summary="Сброс кеша",
+             description="Удаляет из кеша документы и страницы списков, "
+                         "в которые они попали. Вызывается ETL после "
+                         "загрузки изменений в Elasticsearch",
+             response_description="Число удалённых ключей",
+             )
+async def cache_invalidate(event: InvalidationModel,
+                           redis: Redis = Depends(get_redis),
+                           token: str = Header(
+                               None, alias=conf.INVALIDATION_TOKEN_HEADER)
+                           ) -> Invalidated:
+    # Без настроенного токена эндпоинт закрыт: ETL без API может
+    # сбрасывать кеш командой commands.invalidate
+    if not settings.CACHE_INVALIDATION_TOKEN:
+        raise HTTPException(status_code=HTTPStatus.FORBIDDEN,
+                            detail='Cache invalidation over HTTP is disabled')
+    if not token or not secrets.compare_digest(
+            token, settings.CACHE_INVALIDATION_TOKEN):
+        raise HTTPException(status_code=HTTPStatus.FORBIDDEN,
+                            detail='Invalid invalidation token')
+
+    keys = await invalidate(redis, event.index, event.ids, event.lists)
+    return Invalidated(purged=len(keys))
@@ -1,13 +1,18 @@
 import core.config as conf
 
 from http import HTTPStatus
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from typing import Annotated
 
-from api.v1 import _details, _list, _get_cache_key
+from api.v1 import _details, _details_many, _export, _export_fields, _list, \
+    _get_cache_key, _page_cursor, _set_next_page_token, _suggest
 from services.service import IdRequestService, ListService
-from services.film import get_film_service, get_film_list_service
-from models.model import Model, PaginateModel
+from services.film import get_film_service, get_film_list_service, \
+    get_film_suggest_service
+from services.genre import get_genre_dictionary
+from services.genre_dictionary import GenreDictionary
+from models.model import BatchModel, Model, PaginateModel
 
 # FastAPI в качестве моделей использует библиотеку pydantic
 # https://pydantic-docs.helpmanual.io
@@ -18,6 +23,10 @@ from models.model import Model, PaginateModel
 router = APIRouter()
 Paginate = Annotated[PaginateModel, Depends(PaginateModel)]
 INDEX = 'movies'
+# Поля документа фильма в индексе, доступные для выгрузки
+EXPORT_FIELDS = ('id', 'title', 'imdb_rating', 'description', 'genre',
+                 'actors', 'writers', 'directors', 'actors_names',
+                 'writers_names')
 
 
 # Модель ответа API
@@ -38,6 +47,53 @@ class FilmList(Model):
     imdb_rating: float | None = None
 
 
+class GenreFacet(Model):
+    uuid: str
+    name: str | None = None
+    count: int
+
+
+class RatingFacet(Model):
+    # Фильмы с рейтингом от rating включительно до rating + шаг
+    rating: float
+    count: int
+
+
+class FilmFacets(Model):
+    total: int
+    genres: list[GenreFacet]
+    imdb_rating: list[RatingFacet]
+
+
+def _title_query(query: str) -> dict:
+    return {
+        "bool": {
+            "must":
+                {"match": {"title": query}}
+        }
+    }
+
+
+FACETS_AGGS = {
+    "genres": {
+        "nested": {"path": "genre"},
+        "aggs": {
+            "ids": {
+                "terms": {"field": "genre.id", "size": conf.FACETS_MAX_GENRES},
+                # Название жанра - из словаря жанров, а если жанра там
+                # нет - из любого его вложенного документа
+                "aggs": {"name": {"top_hits": {"size": 1}}}
+            }
+        }
+    },
+    "imdb_rating": {
+        "histogram": {"field": "imdb_rating",
+                      "interval": conf.FACETS_RATING_INTERVAL,
+                      "min_doc_count": 1}
+    }
+}
+
+
 @router.get('/search',
             response_model=list[FilmList],
             summary="Поиск кинопроизведений",
@@ -46,6 +102,7 @@ class FilmList(Model):
             tags=['Полнотекстовый поиск']
             )
 async def film_search(pagination: Paginate,
+                      response: Response,
                       film_service: ListService = Depends(get_film_list_service),
                       query: str = Query(None,
                                          description=conf.SEARCH_DESC),
@@ -55,23 +112,20 @@ async def film_search(pagination: Paginate,
 
     page = pagination.page_number
     size = pagination.page_size
+    after, pit = await _page_cursor(film_service, INDEX, pagination.page_token)
     if query:
-        search = {
-            "bool": {
-                "must":
-                    {"match": {"title": query}}
-            }
-        }
+        search = _title_query(query)
     else:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=f'Empty `query` attribute')
 
     # Redis caching
-    key = await _get_cache_key({'sort': sort,
-                                'query': query,
-                                'page': page,
-                                'size': size},
-                               INDEX)
+    key = _get_cache_key(film_service, INDEX,
+                         {'sort': sort,
+                          'query': query,
+                          'page': None if after else page,
+                          'size': size,
+                          'after': after})
 
     films = await _list(film_service,
                         index=INDEX,
@@ -79,7 +133,10 @@ async def film_search(pagination: Paginate,
                         sort=sort,
                         key=key,
                         page=page,
-                        size=size)
+                        size=size,
+                        search_after=after,
+                        pit=pit)
+    await _set_next_page_token(response, film_service, films, size)
 
     res = [FilmList(uuid=film.id,
                     title=film.title,
@@ -87,6 +144,87 @@ async def film_search(pagination: Paginate,
     return res
 
 
+class FilmSuggest(Model):
+    uuid: str
+    title: str
+
+
+@router.get('/suggest',
+            response_model=list[FilmSuggest],
+            summary="Подсказки по названию",
+            description="Фильмы, названия которых начинаются с введённого "
+                        "текста, для поиска при наборе",
+            response_description="id и название фильма",
+            tags=['Полнотекстовый поиск']
+            )
+async def film_suggest(film_service: ListService = Depends(get_film_suggest_service),
+                       query: str = Query(...,
+                                          description=conf.SUGGEST_DESC,
+                                          min_length=1,
+                                          max_length=100),
+                       size: int = Query(10,
+                                         description=conf.SUGGEST_SIZE_DESC,
+                                         ge=1,
+                                         le=conf.SUGGEST_MAX_SIZE),
+                       ) -> list[FilmSuggest]:
+    films = await _suggest(film_service, INDEX, 'title', query, size)
+    return [FilmSuggest(uuid=film.id, title=film.title) for film in films]
+
+
+@router.get('/facets',
+            response_model=FilmFacets,
+            summary="Фасеты фильмов",
+            description="Число фильмов по жанрам и интервалам рейтинга, "
+                        "одним запросом; с `query` - среди найденных "
+                        "по названию",
+            response_description="Всего фильмов, число фильмов по жанрам "
+                                 "и по интервалам рейтинга",
+            tags=['Полнотекстовый поиск']
+            )
+async def film_facets(film_service: ListService = Depends(get_film_list_service),
+                      genre_dictionary: GenreDictionary = Depends(get_genre_dictionary),
+                      query: str = Query(None,
+                                         description=conf.SEARCH_DESC),
+                      ) -> FilmFacets:
+    search = _title_query(query) if query else None
+    key = _get_cache_key(film_service, INDEX,
+                         {'facets': 'genres,imdb_rating',
+                          'query': query})
+    res = await film_service.get_aggs(INDEX, FACETS_AGGS, search, key)
+    if res is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f'{INDEX} not found')
+
+    aggs = res['aggregations']
+    genres = []
+    for bucket in aggs['genres']['ids']['buckets']:
+        hits = bucket['name']['hits']['hits']
+        genres.append(GenreFacet(
+            uuid=bucket['key'],
+            name=genre_dictionary.name(
+                bucket['key'],
+                hits[0]['_source'].get('name') if hits else None),
+            count=bucket['doc_count']))
+    ratings = [RatingFacet(rating=bucket['key'], count=bucket['doc_count'])
+               for bucket in aggs['imdb_rating']['buckets']]
+    return FilmFacets(total=res['total'], genres=genres, imdb_rating=ratings)
+
+
+@router.get('/export',
+            summary="Выгрузка фильмов",
+            description="Все фильмы потоком NDJSON, по документу индекса "
+                        "на строку",
+            response_description="Документы фильмов с полями `fields`",
+            response_class=StreamingResponse
+            )
+async def film_export(film_service: ListService = Depends(get_film_list_service),
+                      fields: str = Query(None,
+                                          description=conf.EXPORT_FIELDS_DESC),
+                      ) -> StreamingResponse:
+    return await _export(film_service, INDEX,
+                         _export_fields(fields, EXPORT_FIELDS))
+
+
 # С помощью декоратора регистрируем обработчик film_details
 # На обработку запросов по адресу <some_prefix>/some_id
 # Позже подключим роутер к корневому роутеру
@@ -103,6 +241,7 @@ async def film_search(pagination: Paginate,
                                  "список актеров, режиссеров и сценаристов",
             )
 async def film_details(film_service: IdRequestService = Depends(get_film_service),
+                       genre_dictionary: GenreDictionary = Depends(get_genre_dictionary),
                        film_id: str = None) -> Film:
     film = await _details(film_service, film_id, INDEX)
     # Перекладываем данные из models.Film в Film.
@@ -112,11 +251,31 @@ async def film_details(film_service: IdRequestService = Depends(get_film_service
     # ответов API вы бы предоставляли клиентам данные, которые им не нужны
     # и, возможно, данные, которые опасно возвращать
 
+    return _to_film(film, genre_dictionary)
+
+
+@router.post('/batch',
+             response_model=list[Film],
+             summary="Детали нескольких фильмов",
+             description="Доступная информация по списку фильмов за один "
+                         "запрос. Ненайденные id пропускаются",
+             response_description="Фильмы в порядке запрошенных id",
+             )
+async def film_batch(batch: BatchModel,
+                     film_service: IdRequestService = Depends(get_film_service),
+                     genre_dictionary: GenreDictionary = Depends(get_genre_dictionary)
+                     ) -> list[Film]:
+    films = await _details_many(film_service, batch.ids, INDEX)
+    return [_to_film(film, genre_dictionary) for film in films]
+
+
+def _to_film(film, genre_dictionary: GenreDictionary) -> Film:
+    # Названия жанров - из словаря в памяти, а не из копии в документе
     return Film(uuid=film.id,
                 title=film.title,
                 imdb_rating=film.imdb_rating,
                 description=film.description,
-                genre=film.genre,
+                genre=genre_dictionary.resolve(film.genre),
                 actors=film.actors,
                 writers=film.writers,
                 directors=film.directors)
@@ -129,15 +288,22 @@ async def film_details(film_service: IdRequestService = Depends(get_film_service
             response_description="id, название, рейтинг",
             )
 async def film_list(pagination: Paginate,
+                    response: Response,
                     film_service: ListService = Depends(get_film_list_service),
+                    genre_dictionary: GenreDictionary = Depends(get_genre_dictionary),
                     sort: str = Query(None,
                                       description=conf.SORT_DESC),
                     genre: str = Query(None,
                                        description=conf.GENRE_DESC)
                     ) -> list[FilmList]:
+    # Несуществующий жанр отсекаем до кеша и ES
+    if genre and not await genre_dictionary.exists(genre):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f'{genre} not found in genres')
 
     page = pagination.page_number
     size = pagination.page_size
+    after, pit = await _page_cursor(film_service, INDEX, pagination.page_token)
 
     if genre:
         search = {
@@ -154,11 +320,12 @@ async def film_list(pagination: Paginate,
     else:
         search = None
 
-    key = await _get_cache_key({'sort': sort,
-                                'genre': genre,
-                                'page': page,
-                                'size': size},
-                               INDEX)
+    key = _get_cache_key(film_service, INDEX,
+                         {'sort': sort,
+                          'genre': genre,
+                          'page': None if after else page,
+                          'size': size,
+                          'after': after})
 
     films = await _list(film_service,
                         index=INDEX,
@@ -166,7 +333,10 @@ async def film_list(pagination: Paginate,
                         search=search,
                         key=key,
                         page=page,
-                        size=size)
+                        size=size,
+                        search_after=after,
+                        pit=pit)
+    await _set_next_page_token(response, film_service, films, size)
 
     res = [FilmList(uuid=film.id,
                     title=film.title,
@@ -1,10 +1,9 @@
-from fastapi import APIRouter, Depends, Query
-from api.v1 import _details, _list
-from models.model import Model
-from services.service import IdRequestService, ListService
-from services.genre import get_genre_service, get_genre_list_service
+from http import HTTPStatus
 
-from src.api.v1 import _get_cache_key
+from fastapi import APIRouter, Depends, HTTPException
+from models.model import BatchModel, Model
+from services.genre import get_genre_dictionary
+from services.genre_dictionary import GenreDictionary
 
 router = APIRouter()
 INDEX = 'genres'
@@ -16,32 +15,55 @@ class Genre(Model):
     name: str | None = None
 
 
+# Жанры отдаются из словаря в памяти воркера, без Redis и ES
 @router.get('/{genre_id}',
             response_model=Genre,
             summary="Детали жанра",
             description="Доступная информация по одному жанру",
             response_description="id, название"
             )
-async def genre_details(genre_service: IdRequestService = Depends(get_genre_service),
+async def genre_details(genre_dictionary: GenreDictionary = Depends(get_genre_dictionary),
                         genre_id: str = None) -> Genre:
-    genre = await _details(genre_service, genre_id, INDEX)
+    genre = await genre_dictionary.get(genre_id)
+    if not genre:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f'{genre_id} not found in {INDEX}')
 
     return Genre(uuid=genre.id,
                  name=genre.name)
 
 
+@router.post('/batch',
+             response_model=list[Genre],
+             summary="Детали нескольких жанров",
+             description="Доступная информация по списку жанров за один "
+                         "запрос. Ненайденные id пропускаются",
+             response_description="id, название"
+             )
+async def genre_batch(batch: BatchModel,
+                      genre_dictionary: GenreDictionary = Depends(get_genre_dictionary)
+                      ) -> list[Genre]:
+    genres = await genre_dictionary.get_many(batch.ids)
+    if not genres:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f'{batch.ids} not found in {INDEX}')
+
+    return [Genre(uuid=genre.id,
+                  name=genre.name) for genre in genres]
+
+
 @router.get('/',
             response_model=list[Genre],
             summary="Список жанров",
             description="Список жанров с информацией о id, названии",
             response_description="id, название"
             )
-async def genre_list(genre_service: ListService = Depends(get_genre_list_service)
+async def genre_list(genre_dictionary: GenreDictionary = Depends(get_genre_dictionary)
                      ) -> list[Genre]:
-    key = await _get_cache_key(index=INDEX)
-    genres = await _list(genre_service,
-                         index=INDEX,
-                         key=key)
+    genres = await genre_dictionary.all()
+    if not genres:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f'{INDEX} not found')
 
     res = [Genre(uuid=genre.id,
                  name=genre.name) for genre in genres]
@@ -2,20 +2,25 @@ import core.config as conf
 
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from typing import Annotated
 
-from api.v1 import _details, _list, _get_cache_key, _films_for_person, \
-    _films_to_list
-from models.model import Model, PaginateModel
+from api.v1 import _details, _details_many, _export, _export_fields, _list, \
+    _get_cache_key, _person_films, _page_cursor, _set_next_page_token, \
+    _suggest
+from models.model import BatchModel, Model, PaginateModel
 from services.service import IdRequestService, ListService
-from services.person import get_person_service, get_person_list_service
-from services.film import get_film_list_service
+from services.person import get_person_service, get_person_list_service, \
+    get_person_suggest_service
+from services.film import get_person_films_service
 from api.v1.films import FilmList
 
 router = APIRouter()
 Paginate = Annotated[PaginateModel, Depends(PaginateModel)]
 INDEX = 'persons'
+# Поля документа персоны в индексе, доступные для выгрузки
+EXPORT_FIELDS = ('id', 'full_name', 'films')
 
 
 # Модель ответа API
@@ -34,14 +39,17 @@ class Person(Model):
             tags=['Полнотекстовый поиск']
             )
 async def person_search(pagination: Paginate,
+                        response: Response,
                         person_service: ListService = Depends(get_person_list_service),
-                        film_service: ListService = Depends(get_film_list_service),
+                        film_service: ListService = Depends(get_person_films_service),
                         query: str = Query(None,
                                            description=conf.SEARCH_DESC),
                         ) -> list[Person]:
 
     page = pagination.page_number
     size = pagination.page_size
+    after, pit = await _page_cursor(person_service, INDEX,
+                                    pagination.page_token)
 
     if query:
         search = {
@@ -54,35 +62,91 @@ async def person_search(pagination: Paginate,
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail=f'Empty `query` attribute')
 
-    key = await _get_cache_key({'query': query,
-                                'page': page,
-                                'size': size},
-                               INDEX)
+    key = _get_cache_key(person_service, INDEX,
+                         {'query': query,
+                          'page': None if after else page,
+                          'size': size,
+                          'after': after})
 
     persons = await _list(person_service,
                           index=INDEX,
                           search=search,
                           key=key,
                           page=page,
-                          size=size)
+                          size=size,
+                          search_after=after,
+                          pit=pit)
+    await _set_next_page_token(response, person_service, persons, size)
 
-    res = [Person(uuid=person.id,
-                  full_name=person.full_name,
-                  films=_films_to_list(
-                      person.id,
-                      await _films_for_person(
-                          film_service,
-                          person.id,
-                          key=await _get_cache_key({'person_id': person.id,
-                                                    'query': query,
-                                                    'page': page,
-                                                    'size': size},
-                                                   'movies'))))
-           for person in persons]
+    films = await _person_films(film_service, persons)
+
+    res = [_to_person(person, films[person.id]) for person in persons]
 
     return res
 
 
+class PersonSuggest(Model):
+    uuid: str
+    full_name: str
+
+
+@router.get('/suggest',
+            response_model=list[PersonSuggest],
+            summary="Подсказки по имени",
+            description="Персоны, имена которых начинаются с введённого "
+                        "текста, для поиска при наборе",
+            response_description="id и имя персоны",
+            tags=['Полнотекстовый поиск']
+            )
+async def person_suggest(person_service: ListService = Depends(get_person_suggest_service),
+                         query: str = Query(...,
+                                            description=conf.SUGGEST_DESC,
+                                            min_length=1,
+                                            max_length=100),
+                         size: int = Query(10,
+                                           description=conf.SUGGEST_SIZE_DESC,
+                                           ge=1,
+                                           le=conf.SUGGEST_MAX_SIZE),
+                         ) -> list[PersonSuggest]:
+    persons = await _suggest(person_service, INDEX, 'full_name', query, size)
+    return [PersonSuggest(uuid=person.id, full_name=person.full_name)
+            for person in persons]
+
+
+@router.get('/export',
+            summary="Выгрузка персон",
+            description="Все персоны потоком NDJSON, по документу индекса "
+                        "на строку",
+            response_description="Документы персон с полями `fields`",
+            response_class=StreamingResponse
+            )
+async def person_export(person_service: ListService = Depends(get_person_list_service),
+                        fields: str = Query(None,
+                                            description=conf.EXPORT_FIELDS_DESC),
+                        ) -> StreamingResponse:
+    return await _export(person_service, INDEX,
+                         _export_fields(fields, EXPORT_FIELDS))
+
+
+@router.post('/batch',
+             response_model=list[Person],
+             summary="Информация о нескольких персонах",
+             description="Доступная информация по списку персон за один "
+                         "запрос. Ненайденные id пропускаются",
+             response_description="id, имя, id фильма и роли персоны в этом "
+                                  "фильме",
+             )
+async def person_batch(batch: BatchModel,
+                       person_service: IdRequestService = Depends(get_person_service),
+                       film_service: ListService = Depends(get_person_films_service)
+                       ) -> list[Person]:
+    persons = await _details_many(person_service, batch.ids, INDEX)
+
+    films = await _person_films(film_service, persons)
+
+    return [_to_person(person, films[person.id]) for person in persons]
+
+
 @router.get('/{person_id}',
             response_model=Person,
             summary="Информация о персоне",
@@ -91,20 +155,12 @@ async def person_search(pagination: Paginate,
                                  "фильме",
             )
 async def person_details(person_service: IdRequestService = Depends(get_person_service),
-                         film_service: ListService = Depends(get_film_list_service),
+                         film_service: ListService = Depends(get_person_films_service),
                          person_id: str = None) -> Person:
     person = await _details(person_service, person_id, INDEX)
+    films = await _person_films(film_service, [person])
 
-    key = await _get_cache_key({'person_id': person_id},
-                               'movies')
-
-    films_res = _films_to_list(person_id,
-                               await _films_for_person(film_service,
-                                                       person_id,
-                                                       key))
-    return Person(uuid=person.id,
-                  full_name=person.full_name,
-                  films=films_res)
+    return _to_person(person, films[person.id])
 
 
 @router.get('/{person_id}/film',
@@ -113,13 +169,23 @@ async def person_details(person_service: IdRequestService = Depends(get_person_s
             description="Список Фильмов по персоне.",
             response_description="Список фильмов с id, название, рейтинг",
             )
-async def films_by_person(film_service: ListService = Depends(get_film_list_service),
+async def films_by_person(person_service: IdRequestService = Depends(get_person_service),
+                          film_service: ListService = Depends(get_person_films_service),
                           person_id: str = None) -> list[FilmList]:
-    key = await _get_cache_key({'person_id': person_id},
-                               'movies')
-    films = await _films_for_person(film_service, person_id, key)
+    person = await _details(person_service, person_id, INDEX)
+    films = (await _person_films(film_service, [person]))[person.id]
+    if not films:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail='movies not found')
 
-    res = [FilmList(uuid=film.id,
-                    title=film.title,
-                    imdb_rating=film.imdb_rating) for film in films]
+    res = [FilmList(uuid=film['id'],
+                    title=film['title'],
+                    imdb_rating=film['imdb_rating']) for film in films]
     return res
+
+
+def _to_person(person, films: list[dict]) -> Person:
+    return Person(uuid=person.id,
+                  full_name=person.full_name,
+                  films=[{'uuid': film['id'], 'roles': film['roles']}
+                         for film in films])
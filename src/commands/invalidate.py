@@ -0,0 +1,38 @@
+"""
+Сбрасывает кеш документов индекса и страниц, в которые они попали.
+
+    python -m commands.invalidate movies <id> [<id> ...]
+    python -m commands.invalidate movies --lists  # все страницы списков
+
+Для ETL, который пишет в Elasticsearch в обход API.
+"""
+import argparse
+import asyncio
+
+
+async def run(index: str, ids: list[str], lists: bool) -> int:
+    from db.redis import create_redis
+    from services.invalidation import invalidate
+
+    redis = create_redis()
+    try:
+        return len(await invalidate(redis, index, ids, lists))
+    finally:
+        await redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.add_argument('index', choices=['movies', 'genres', 'persons'])
+    parser.add_argument('ids', nargs='*')
+    parser.add_argument('--lists', action='store_true',
+                        help='сбросить все страницы списков индекса')
+    args = parser.parse_args()
+
+    purged = asyncio.run(run(args.index, args.ids, args.lists))
+    print(f'{purged} keys purged')
+
+
+if __name__ == '__main__':
+    main()
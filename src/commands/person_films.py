@@ -0,0 +1,113 @@
+"""
+Материализует фильмы персоны с ролями в документы индекса persons.
+
+    # пересобрать es_index/persons.3.data.json
+    python -m commands.person_films dump
+    # обновить индекс persons в ES
+    python -m commands.person_films refresh
+
+Источник в обоих случаях - дампы из es_index.
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+ES_INDEX_DIR = Path(__file__).resolve().parents[2] / 'es_index'
+MOVIES_DUMP = 'movies.3.data.json'
+PERSONS_DUMP = 'persons.3.data.json'
+PERSONS_MAPPING = 'persons.2.mapping.json'
+ROLES = (('actor', 'actors'), ('writer', 'writers'), ('director', 'directors'))
+
+
+def read_dump(path: Path) -> list[dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def collect_person_films(movies: list[dict]) -> dict[str, list[dict]]:
+    person_films: dict[str, dict[str, dict]] = {}
+    for movie in movies:
+        for role, field in ROLES:
+            for person in movie.get(field) or []:
+                films = person_films.setdefault(person['id'], {})
+                film = films.setdefault(
+                    movie['id'],
+                    {'id': movie['id'],
+                     'title': movie['title'],
+                     'imdb_rating': movie.get('imdb_rating'),
+                     'roles': []})
+                if role not in film['roles']:
+                    film['roles'].append(role)
+
+    return {person_id: sorted(films.values(), key=lambda film: film['id'])
+            for person_id, films in person_films.items()}
+
+
+def load_person_films(es_index_dir: Path) -> dict[str, list[dict]]:
+    movies = [doc['_source'] for doc in read_dump(es_index_dir / MOVIES_DUMP)]
+    return collect_person_films(movies)
+
+
+def dump(es_index_dir: Path):
+    person_films = load_person_films(es_index_dir)
+    persons_path = es_index_dir / PERSONS_DUMP
+    persons = read_dump(persons_path)
+    with open(persons_path, 'w', encoding='utf-8') as f:
+        for doc in persons:
+            doc['_source']['films'] = person_films.get(doc['_id'], [])
+            f.write(json.dumps(doc, ensure_ascii=False,
+                               separators=(',', ':')) + '\n')
+
+
+async def refresh(es_index_dir: Path):
+    from elasticsearch.helpers import async_bulk, async_scan
+
+    from db.elastic import create_elastic
+
+    person_films = load_person_films(es_index_dir)
+    mapping = json.loads((es_index_dir / PERSONS_MAPPING).read_text())
+    es = create_elastic()
+    try:
+        await es.indices.put_mapping(
+            index='persons',
+            body={'properties': {
+                'films': mapping['persons']['mappings']['properties']['films']
+            }})
+        # Обходим все персоны индекса: у тех, чьи фильмы удалены, films
+        # становится [], как в dump. Документы без изменений не трогаем
+        changed = {}
+        async for doc in async_scan(es, index='persons',
+                                    _source_includes=['films']):
+            films = person_films.get(doc['_id'], [])
+            if doc['_source'].get('films') != films:
+                changed[doc['_id']] = films
+        actions = ({'_op_type': 'update',
+                    '_index': 'persons',
+                    '_id': person_id,
+                    'doc': {'films': films}}
+                   for person_id, films in changed.items())
+        await async_bulk(es, actions, raise_on_error=False)
+    finally:
+        await es.close()
+
+    # Персоны в кеше собраны до обновления - сбрасываем их и списки
+    from commands.invalidate import run
+    await run('persons', list(changed), lists=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.add_argument('action', choices=['dump', 'refresh'])
+    parser.add_argument('--es-index-dir', type=Path, default=ES_INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.action == 'dump':
+        dump(args.es_index_dir)
+    else:
+        asyncio.run(refresh(args.es_index_dir))
+
+
+if __name__ == '__main__':
+    main()
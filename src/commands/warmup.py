@@ -0,0 +1,35 @@
+"""
+Прогревает кеш теми же запросами, что и воркер при старте.
+
+    python -m commands.warmup
+
+Удобно запускать после деплоя с WARMUP_ON_STARTUP=false, чтобы прогрев
+шёл один раз, а не в каждом воркере.
+"""
+import argparse
+import asyncio
+
+
+async def run():
+    import main
+    from services.warmup import warm_up
+
+    await main.startup()
+    try:
+        return await warm_up(main.app)
+    finally:
+        await main.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.parse_args()
+
+    statuses = asyncio.run(run())
+    print(', '.join(f'{status}: {count}'
+                    for status, count in sorted(statuses.items())))
+
+
+if __name__ == '__main__':
+    main()
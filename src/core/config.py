@@ -1,4 +1,6 @@
 from logging import config as logging_config
+from typing import Literal
+
 from pydantic import BaseSettings, Field
 
 from core.logger import LOGGING
@@ -13,8 +15,152 @@ class Settings(BaseSettings):
     REDIS_PORT: int = Field(..., env='REDIS_PORT')
     ELASTIC_HOST: str = Field(..., env='ELASTIC_HOST')
     ELASTIC_PORT: int = Field(..., env='ELASTIC_PORT')
+    # Пул соединений Redis: сколько всего, сколько секунд ждать свободное,
+    # таймауты сокета и повторы с экспоненциальной задержкой (в секундах)
+    REDIS_MAX_CONNECTIONS: int = Field(100, env='REDIS_MAX_CONNECTIONS')
+    REDIS_POOL_TIMEOUT: float = Field(5, env='REDIS_POOL_TIMEOUT')
+    REDIS_SOCKET_TIMEOUT: float = Field(2, env='REDIS_SOCKET_TIMEOUT')
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = Field(
+        2, env='REDIS_SOCKET_CONNECT_TIMEOUT')
+    REDIS_HEALTH_CHECK_INTERVAL: int = Field(30,
+                                             env='REDIS_HEALTH_CHECK_INTERVAL')
+    REDIS_RETRIES: int = Field(3, env='REDIS_RETRIES')
+    REDIS_RETRY_BACKOFF_BASE: float = Field(0.01,
+                                            env='REDIS_RETRY_BACKOFF_BASE')
+    REDIS_RETRY_BACKOFF_CAP: float = Field(0.5, env='REDIS_RETRY_BACKOFF_CAP')
+    # Размыкатель цепи перед ES: после ES_BREAKER_FAILURE_THRESHOLD ошибок,
+    # таймаутов (ES_BREAKER_CALL_TIMEOUT) или медленных ответов
+    # (ES_BREAKER_SLOW_CALL) подряд запросы в ES не идут
+    # ES_BREAKER_RESET_TIMEOUT секунд. Время - в секундах, 0 - без ограничения
+    ES_BREAKER_ENABLED: bool = Field(True, env='ES_BREAKER_ENABLED')
+    ES_BREAKER_FAILURE_THRESHOLD: int = Field(
+        5, env='ES_BREAKER_FAILURE_THRESHOLD')
+    ES_BREAKER_CALL_TIMEOUT: float = Field(2, env='ES_BREAKER_CALL_TIMEOUT')
+    ES_BREAKER_SLOW_CALL: float = Field(1, env='ES_BREAKER_SLOW_CALL')
+    ES_BREAKER_RESET_TIMEOUT: float = Field(10, env='ES_BREAKER_RESET_TIMEOUT')
+    # Несколько узлов ES в виде host:port; если не заданы -
+    # ELASTIC_HOST:ELASTIC_PORT. MAXSIZE - соединений на узел
+    ELASTIC_HOSTS: list[str] = Field([], env='ELASTIC_HOSTS')
+    ELASTIC_MAXSIZE: int = Field(25, env='ELASTIC_MAXSIZE')
+    ELASTIC_TIMEOUT: float = Field(10, env='ELASTIC_TIMEOUT')
+    ELASTIC_MAX_RETRIES: int = Field(3, env='ELASTIC_MAX_RETRIES')
+    ELASTIC_RETRY_ON_TIMEOUT: bool = Field(True,
+                                           env='ELASTIC_RETRY_ON_TIMEOUT')
+    # Обновлять список узлов кластера при старте, при ошибке соединения
+    # и раз в ELASTIC_SNIFFER_TIMEOUT секунд
+    ELASTIC_SNIFF: bool = Field(False, env='ELASTIC_SNIFF')
+    ELASTIC_SNIFFER_TIMEOUT: float = Field(60, env='ELASTIC_SNIFFER_TIMEOUT')
+    # Срок обработки запроса в секундах (0 - без ограничения), отдельно
+    # по шаблонам путей эндпоинтов; после него запрос получает 503, а срок
+    # ограничивает и запросы к ES
+    REQUEST_TIMEOUT: float = Field(5, env='REQUEST_TIMEOUT')
+    REQUEST_TIMEOUTS: dict[str, float] = Field(
+        # Выгрузка идёт, пока клиент читает поток
+        {'/api/v1/films/export': 0,
+         '/api/v1/persons/export': 0},
+        env='REQUEST_TIMEOUTS')
+    # Одновременных запросов к тяжёлым эндпоинтам на воркер; не дождавшийся
+    # места за CONCURRENCY_QUEUE_TIMEOUT секунд запрос получает 429.
+    # Эндпоинты без лимита (поиск по id) не ограничиваются
+    CONCURRENCY_LIMITS: dict[str, int] = Field(
+        {'/api/v1/films/': 64,
+         '/api/v1/films/search': 32,
+         '/api/v1/films/facets': 32,
+         '/api/v1/films/batch': 32,
+         '/api/v1/persons/search': 16,
+         '/api/v1/persons/batch': 32,
+         '/api/v1/persons/{person_id}/film': 32,
+         '/api/v1/films/export': 2,
+         '/api/v1/persons/export': 2},
+        env='CONCURRENCY_LIMITS')
+    CONCURRENCY_QUEUE_TIMEOUT: float = Field(0.5,
+                                             env='CONCURRENCY_QUEUE_TIMEOUT')
+    # Число процессов gunicorn, 0 - по числу ядер
+    WORKERS: int = Field(0, env='WORKERS')
     HOST: str = Field(..., env='HOST')
     PORT: int = Field(..., env='PORT')
+    # local - объединение промахов кеша внутри воркера,
+    # redis - дополнительно между воркерами через блокировку в Redis
+    SINGLE_FLIGHT_MODE: Literal['local', 'redis'] = Field(
+        'local', env='SINGLE_FLIGHT_MODE')
+    SINGLE_FLIGHT_LOCK_TIMEOUT: int = Field(5000,
+                                            env='SINGLE_FLIGHT_LOCK_TIMEOUT')
+    SINGLE_FLIGHT_POLL_INTERVAL: int = Field(50,
+                                             env='SINGLE_FLIGHT_POLL_INTERVAL')
+    # Кеш распарсенных объектов в памяти воркера перед Redis.
+    # TTL в секундах задаётся отдельно для каждого индекса, 0 - не кешировать
+    L1_CACHE_ENABLED: bool = Field(True, env='L1_CACHE_ENABLED')
+    L1_CACHE_SIZE: int = Field(1024, env='L1_CACHE_SIZE')
+    L1_CACHE_TTL: dict[str, int] = Field({'movies': 30,
+                                          'genres': 60 * 60,
+                                          'persons': 30,
+                                          'responses': 5,
+                                          'suggest': 10},
+                                         env='L1_CACHE_TTL')
+    # Формат записей в Redis: orjson или msgpack; сжатие zlib, zstd
+    # (пакет zstandard) или lz4 (пакет lz4). Записи старого формата
+    # читаются при любых настройках
+    CACHE_SERIALIZER: str = Field('orjson', env='CACHE_SERIALIZER')
+    CACHE_COMPRESSION: str = Field('zlib', env='CACHE_COMPRESSION')
+    # Документы и страницы списков крупнее порога (в байтах) сжимаются
+    # в кеше, 0 - не сжимать
+    CACHE_COMPRESS_THRESHOLD: int = Field(1024,
+                                          env='CACHE_COMPRESS_THRESHOLD')
+    LIST_CACHE_COMPRESS_THRESHOLD: int = Field(
+        16 * 1024, env='LIST_CACHE_COMPRESS_THRESHOLD')
+    # Входит в пространство имён ключей кеша: увеличение делает все
+    # записи недоступными без FLUSHDB
+    CACHE_KEY_VERSION: int = Field(1, env='CACHE_KEY_VERSION')
+    # Подсказки при наборе: время жизни в Redis, в секундах
+    SUGGEST_CACHE_TTL: int = Field(60, env='SUGGEST_CACHE_TTL')
+    # Время жизни записей в Redis по индексам, в секундах. Изменения в ES
+    # сбрасывают кеш через инвалидацию по тегам, поэтому TTL большие
+    CACHE_TTL: dict[str, int] = Field({'movies': 60 * 60,
+                                       'genres': 24 * 60 * 60,
+                                       'persons': 60 * 60},
+                                      env='CACHE_TTL')
+    # После мягкого TTL запись ещё отдаётся из кеша, но обновляется из ES
+    # в фоне; ждать ES приходится только после жёсткого CACHE_TTL.
+    # 0 - не обновлять заранее
+    CACHE_SOFT_TTL: dict[str, int] = Field({'movies': 5 * 60,
+                                            'genres': 60 * 60,
+                                            'persons': 5 * 60},
+                                           env='CACHE_SOFT_TTL')
+    # Жанры в памяти воркера перечитываются из ES раз в столько секунд
+    # и сразу после инвалидации индекса genres
+    GENRE_DICTIONARY_REFRESH_INTERVAL: int = Field(
+        5 * 60, env='GENRE_DICTIONARY_REFRESH_INTERVAL')
+    # Канал Redis, через который воркеры узнают о сброшенных ключах
+    CACHE_INVALIDATION_CHANNEL: str = Field('cache:invalidate',
+                                            env='CACHE_INVALIDATION_CHANNEL')
+    # POST /api/v1/cache/invalidate требует заголовок X-Invalidation-Token
+    # с этим значением; если не задан, эндпоинт отвечает 403
+    CACHE_INVALIDATION_TOKEN: str | None = Field(
+        None, env='CACHE_INVALIDATION_TOKEN')
+    # Кеш готовых ответов GET-эндпоинтов: RESPONSE_CACHE_TTL - в Redis,
+    # RESPONSE_CACHE_MAX_AGE - для клиентов и прокси в Cache-Control
+    RESPONSE_CACHE_ENABLED: bool = Field(True, env='RESPONSE_CACHE_ENABLED')
+    RESPONSE_CACHE_TTL: int = Field(60, env='RESPONSE_CACHE_TTL')
+    RESPONSE_CACHE_MAX_AGE: int = Field(30, env='RESPONSE_CACHE_MAX_AGE')
+    # Прогрев кеша при старте воркера: первые WARMUP_PAGES
+    # страниц фильмов по сортировкам и жанрам, WARMUP_TOP_FILMS лучших
+    # фильмов, WARMUP_PATHS и WARMUP_HOT_PATHS самых частых путей,
+    # записанных с долей WARMUP_RECORD_RATE запросов за последние
+    # WARMUP_HOT_WINDOWS часов
+    WARMUP_ON_STARTUP: bool = Field(True, env='WARMUP_ON_STARTUP')
+    WARMUP_CONCURRENCY: int = Field(4, env='WARMUP_CONCURRENCY')
+    WARMUP_PAGES: int = Field(2, env='WARMUP_PAGES')
+    WARMUP_TOP_FILMS: int = Field(100, env='WARMUP_TOP_FILMS')
+    WARMUP_PATHS: list[str] = Field([], env='WARMUP_PATHS')
+    WARMUP_HOT_PATHS: int = Field(200, env='WARMUP_HOT_PATHS')
+    WARMUP_RECORD_RATE: float = Field(0.01, env='WARMUP_RECORD_RATE')
+    WARMUP_HOT_WINDOWS: int = Field(24, env='WARMUP_HOT_WINDOWS')
+    # Документов в одной пачке потоковой выгрузки индекса
+    EXPORT_BATCH_SIZE: int = Field(500, env='EXPORT_BATCH_SIZE')
+    # Закреплять постраничный обход по page_token за point-in-time
+    PAGINATION_USE_PIT: bool = Field(False, env='PAGINATION_USE_PIT')
+    PAGINATION_PIT_KEEP_ALIVE: str = Field('1m',
+                                           env='PAGINATION_PIT_KEEP_ALIVE')
 
     class Config:
         env_file = '.env'
@@ -29,4 +175,24 @@ PAGE_DESC = "Номер страницы"
 PAGE_ALIAS = "page_number"
 SIZE_DESC = "Количество элементов на странице"
 SIZE_ALIAS = "page_size"
+PAGE_TOKEN_DESC = "Токен следующей страницы из заголовка X-Next-Page-Token. " \
+                  "Если указан, page_number не используется"
+PAGE_TOKEN_ALIAS = "page_token"
+NEXT_PAGE_TOKEN_HEADER = "X-Next-Page-Token"
+# Ограничение Elasticsearch на from + size (index.max_result_window)
+ES_MAX_RESULT_WINDOW = 10000
 GENRE_DESC = "Жанр фильма"
+BATCH_IDS_DESC = "Список id, не больше 100"
+BATCH_MAX_IDS = 100
+SUGGEST_DESC = "Начало названия или имени"
+SUGGEST_SIZE_DESC = "Количество подсказок"
+SUGGEST_MAX_SIZE = 20
+# Жанров в фасетах и шаг интервалов рейтинга
+FACETS_MAX_GENRES = 100
+FACETS_RATING_INTERVAL = 1
+EXPORT_FIELDS_DESC = "Поля документа через запятую, по умолчанию все"
+INVALIDATION_TOKEN_HEADER = "X-Invalidation-Token"
+INVALIDATION_IDS_DESC = "id изменённых документов индекса"
+INVALIDATION_LISTS_DESC = "Сбросить все страницы списков индекса: " \
+                          "документы добавлены или удалены, изменились " \
+                          "поля сортировки или фильтров"
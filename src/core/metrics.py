@@ -0,0 +1,143 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, \
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+
+# Шаблон пути текущего запроса, например /api/v1/films/{film_id}
+endpoint: ContextVar[str] = ContextVar('endpoint', default='')
+
+BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+# Параметры, из которых cache_keys.list_key собирает ключ; по ним
+# определяется семейство ключа, сами значения в метки не попадают
+KEY_PARAMS = ('sort', 'genre', 'query', 'page', 'size', 'after', 'person_id',
+              'suggest', 'facets')
+
+REQUEST_SECONDS = Histogram('api_request_seconds',
+                            'Время обработки запроса',
+                            ['method', 'endpoint', 'status'],
+                            buckets=BUCKETS)
+STAGE_SECONDS = Histogram('api_stage_seconds',
+                          'Время этапа обработки запроса',
+                          ['stage', 'index', 'endpoint'],
+                          buckets=BUCKETS)
+CACHE_EVENTS = Counter('api_cache_events_total',
+                       'Попадания и промахи кеша по семействам ключей',
+                       ['family', 'event'])
+
+
+@contextmanager
+def timer(stage: str, index: str = ''):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage, index or '', endpoint.get()).observe(
+            time.perf_counter() - started)
+
+
+def key_family(key: str, index: str = '') -> str:
+    # movies:FilmShort.1a2b3c4d:list:page:1:sort:-imdb_rating
+    # -> movies:page,sort
+    parts = key.split(':') if key else []
+    if len(parts) < 3 or parts[2] != 'list':
+        return f'{index}:id'
+    # Значения с ':' ключ хранит хешем, поэтому имена параметров -
+    # каждая вторая часть
+    params = [part for part in parts[3::2] if part in KEY_PARAMS]
+    return ':'.join([parts[0], ','.join(params)]) if params else parts[0]
+
+
+def cache_event(family: str, event: str, count: int = 1):
+    if count:
+        CACHE_EVENTS.labels(family, event).inc(count)
+
+
+class StatsCollector:
+    """
+    Отдаёт счётчики `stats` объектов сервисов (SingleFlight, LRUCache)
+    в формате Prometheus.
+    """
+    def __init__(self):
+        self._tracked: list[tuple[str, str, object]] = []
+
+    def track(self, kind: str, service: str, obj):
+        if obj is not None:
+            self._tracked.append((kind, service, obj))
+
+    def collect(self):
+        counters = {}
+        sizes = GaugeMetricFamily('api_memory_cache_entries',
+                                  'Записей в кеше в памяти воркера',
+                                  labels=['service'])
+        for kind, service, obj in self._tracked:
+            family = counters.setdefault(kind, CounterMetricFamily(
+                f'api_{kind}', f'События {kind}',
+                labels=['service', 'event']))
+            for event, value in obj.stats.items():
+                family.add_metric([service, event], value)
+            if kind == 'memory_cache':
+                sizes.add_metric([service], len(obj))
+        yield from counters.values()
+        yield sizes
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        with timer('serialize'):
+            return super().render(content)
+
+
+class MetricsMiddleware:
+    # ASGI-middleware: определяет эндпоинт запроса и меряет время ответа
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        # Несовпавшие пути не пишем в метки как есть, иначе их число
+        # ничем не ограничено
+        path = 'unmatched'
+        for route in scope['app'].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                path = route.path
+                break
+        endpoint.set(path)
+
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_SECONDS.labels(scope['method'], path, status['code']) \
+                .observe(time.perf_counter() - started)
+
+
+def render() -> tuple[bytes, str]:
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    # Под gunicorn гистограммы и счётчики суммируются по всем воркерам,
+    # счётчики сервисов - того воркера, который ответил
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(stats_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
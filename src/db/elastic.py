@@ -1,8 +1,39 @@
 from elasticsearch import AsyncElasticsearch
 
+from core.config import settings
+
 es: AsyncElasticsearch | None = None
 
 
+def create_elastic() -> AsyncElasticsearch:
+    hosts = settings.ELASTIC_HOSTS or \
+        [f'{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}']
+    return AsyncElasticsearch(
+        hosts=hosts,
+        # Соединений на каждый узел
+        maxsize=settings.ELASTIC_MAXSIZE,
+        timeout=settings.ELASTIC_TIMEOUT,
+        max_retries=settings.ELASTIC_MAX_RETRIES,
+        retry_on_timeout=settings.ELASTIC_RETRY_ON_TIMEOUT,
+        sniff_on_start=settings.ELASTIC_SNIFF,
+        sniff_on_connection_fail=settings.ELASTIC_SNIFF,
+        sniffer_timeout=settings.ELASTIC_SNIFFER_TIMEOUT
+        if settings.ELASTIC_SNIFF else None)
+
+
+def pool_stats(client: AsyncElasticsearch) -> list[dict]:
+    stats = []
+    for connection in client.transport.connection_pool.connections:
+        session = getattr(connection, 'session', None)
+        connector = session.connector if session else None
+        stats.append({
+            'host': connection.host,
+            'max_connections': getattr(connection, '_limit', None),
+            # Сессия aiohttp создаётся при первом запросе к узлу
+            'in_use': len(connector._acquired) if connector else 0})
+    return stats
+
+
 # Функция понадобится при внедрении зависимостей
 async def get_elastic() -> AsyncElasticsearch:
     return es
@@ -1,9 +1,44 @@
 from typing import Optional
-from redis.asyncio import Redis
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+
+from core.config import settings
 
 redis: Redis | None = None
 
 
+def create_redis() -> Redis:
+    # Когда все соединения заняты, запрос ждёт свободное до
+    # REDIS_POOL_TIMEOUT секунд, а не открывает новое
+    pool = BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(ExponentialBackoff(
+            cap=settings.REDIS_RETRY_BACKOFF_CAP,
+            base=settings.REDIS_RETRY_BACKOFF_BASE), settings.REDIS_RETRIES),
+        retry_on_error=[ConnectionError, TimeoutError])
+    return Redis(connection_pool=pool)
+
+
+def pool_stats(client: Redis) -> dict:
+    pool = client.connection_pool
+    stats = {'max_connections': pool.max_connections}
+    if isinstance(pool, BlockingConnectionPool):
+        # В очереди лежат свободные соединения и заглушки под ещё
+        # не открытые, остальные сейчас заняты
+        stats.update(created=len(pool._connections),
+                     in_use=pool.max_connections - pool.pool.qsize())
+    return stats
+
+
 # Функция понадобится при внедрении зависимостей
 async def get_redis() -> Redis:
     return redis
@@ -0,0 +1,37 @@
+# Боевой запуск: `gunicorn main:app` из каталога src подхватывает этот файл.
+# Каждый воркер - отдельный процесс со своими пулами Redis и ES и кешем в
+# памяти: всё создаётся в lifespan уже после fork
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from core.config import settings
+
+bind = f'{settings.HOST}:{settings.PORT}'
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = settings.WORKERS or multiprocessing.cpu_count()
+# Дольше, чем nginx держит простаивающее соединение к upstream (60 с),
+# чтобы nginx не отправил запрос в уже закрытое воркером соединение
+keepalive = 75
+# Время на завершение текущих запросов при перезапуске и при уменьшении
+# числа воркеров (kill -TTOU)
+graceful_timeout = 30
+timeout = 60
+
+# Метрики prometheus_client собираются со всех воркеров через файлы
+# в общем каталоге
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'api-metrics'))
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,23 +1,30 @@
+import asyncio
 import logging
+import math
+from http import HTTPStatus
 
 import uvicorn
 from contextlib import asynccontextmanager
-from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.responses import ORJSONResponse
-from redis.asyncio import Redis
 
-from api.v1 import films, genres, persons
+from api.v1 import cache, films, genres, persons
+from core import metrics
 from core.config import settings
 from core.logger import LOGGING
 from db import elastic, redis
+from services import codec, invalidation, load_shedding, \
+    response_cache, warmup
+from services.circuit_breaker import ElasticUnavailableError, get_breaker
+from services.genre import get_genre_dictionary
 
 
 async def startup():
-    redis.redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT,
-                        ssl=False)
-    elastic.es = AsyncElasticsearch(
-        hosts=[f'{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}'])
+    # Опечатка в CACHE_SERIALIZER или CACHE_COMPRESSION, как и
+    # неустановленный zstandard или lz4, останавливает запуск воркера
+    codec.get_codec(settings.CACHE_COMPRESS_THRESHOLD)
+    redis.redis = redis.create_redis()
+    elastic.es = elastic.create_elastic()
 
 
 async def shutdown():
@@ -28,7 +35,17 @@ async def shutdown():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await startup()
+    # Сообщения о сброшенных ключах чистят кеш в памяти этого воркера
+    tasks = [asyncio.create_task(invalidation.listen(redis.redis)),
+             # Словарь жанров загружается и обновляется в фоне
+             asyncio.create_task(
+                 get_genre_dictionary(elastic=elastic.es).run())]
+    if settings.WARMUP_ON_STARTUP:
+        # Прогрев идёт в фоне, воркер начинает принимать запросы сразу
+        tasks.append(asyncio.create_task(warmup.warm_up_once(app)))
     yield
+    for task in tasks:
+        task.cancel()
     await shutdown()
 
 app = FastAPI(
@@ -43,16 +60,60 @@ app = FastAPI(
     openapi_url='/api/openapi.json',
     # Можно сразу сделать небольшую оптимизацию сервиса
     # и заменить стандартный JSON-сереализатор на более шуструю версию,
-    # написанную на Rust
-    default_response_class=ORJSONResponse,
+    # написанную на Rust; время сериализации попадает в метрики
+    default_response_class=metrics.TimedORJSONResponse,
     lifespan=lifespan)
 
+# Последний добавленный middleware - внешний: попадания в кеш ответов
+# тоже попадают в метрики, но не занимают лимиты тяжёлых эндпоинтов
+app.add_middleware(load_shedding.LoadSheddingMiddleware)
+app.add_middleware(response_cache.ResponseCacheMiddleware)
+# Время ответа по эндпоинтам; этапы внутри запроса меряют сервисы
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(warmup.HotPathMiddleware)
+
+
+@app.exception_handler(ElasticUnavailableError)
+async def elastic_unavailable(request, exc: ElasticUnavailableError):
+    # Быстрый отказ вместо ожидания таймаута ES: то, что было в кеше,
+    # к этому моменту уже отдано
+    return ORJSONResponse(
+        {'detail': 'Search is temporarily unavailable'},
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(max(1, math.ceil(exc.retry_after)))})
+
+
+@app.get('/metrics', include_in_schema=False)
+async def prometheus_metrics():
+    content, media_type = metrics.render()
+    return Response(content, media_type=media_type)
+
+
+@app.get('/health', include_in_schema=False)
+async def health():
+    # Доступность Redis и ES и загрузка пулов соединений к ним
+    res = {'redis': {'ok': await _ping(redis.redis.ping()),
+                     'pool': redis.pool_stats(redis.redis)},
+           'elastic': {'ok': await _ping(elastic.es.ping(request_timeout=1)),
+                       'pool': elastic.pool_stats(elastic.es),
+                       'breaker': get_breaker().state}}
+    ok = res['redis']['ok'] and res['elastic']['ok']
+    return ORJSONResponse(res, status_code=200 if ok else 503)
+
+
+async def _ping(ping) -> bool:
+    try:
+        return bool(await ping)
+    except Exception:
+        return False
+
 
 # Подключаем роутер к серверу, указав префикс /v1/films
 # Теги указываем для удобства навигации по документации
 app.include_router(films.router, prefix='/api/v1/films', tags=['films'])
 app.include_router(genres.router, prefix='/api/v1/genres', tags=['genres'])
 app.include_router(persons.router, prefix='/api/v1/persons', tags=['persons'])
+app.include_router(cache.router, prefix='/api/v1/cache', tags=['cache'])
 
 
 if __name__ == '__main__':
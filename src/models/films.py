@@ -14,3 +14,14 @@ class Film(Model):
     writers_names: list[str] | None = None
     actors: list[dict] | None = None
     writers: list[dict] | None = None
+
+
+class FilmShort(Model):
+    id: str = Field(..., alias="uuid")
+    title: str
+    imdb_rating: float | None = None
+
+
+class FilmSuggest(Model):
+    id: str = Field(..., alias="uuid")
+    title: str
@@ -1,9 +1,11 @@
+from http import HTTPStatus
+
 import orjson
 
 # Используем pydantic для упрощения работы при перегонке данных из json в
 # объекты
-from pydantic import BaseModel
-from fastapi import Query
+from pydantic import BaseModel, Field
+from fastapi import HTTPException, Query
 
 import core.config as conf
 
@@ -33,6 +35,30 @@ class PaginateModel:
                                         alias=conf.SIZE_ALIAS,
                                         ge=1,
                                         le=500),
+                 page_token: str = Query(None,
+                                         description=conf.PAGE_TOKEN_DESC,
+                                         alias=conf.PAGE_TOKEN_ALIAS),
                  ):
+        # Глубже max_result_window Elasticsearch по from/size не отдаст,
+        # дальше можно идти только по page_token
+        if not page_token and \
+                page_number * page_size > conf.ES_MAX_RESULT_WINDOW:
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail=f'Page is too deep, use `{conf.PAGE_TOKEN_ALIAS}`')
         self.page_number = page_number
         self.page_size = page_size
+        self.page_token = page_token
+
+
+class BatchModel(Model):
+    ids: list[str] = Field(...,
+                           description=conf.BATCH_IDS_DESC,
+                           min_items=1,
+                           max_items=conf.BATCH_MAX_IDS)
+
+
+class InvalidationModel(Model):
+    index: str = Field(..., regex='^(movies|genres|persons)$')
+    ids: list[str] = Field([], description=conf.INVALIDATION_IDS_DESC)
+    lists: bool = Field(False, description=conf.INVALIDATION_LISTS_DESC)
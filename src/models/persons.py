@@ -6,3 +6,10 @@ from models.model import Model
 class Person(Model):
     id: str = Field(..., alias="uuid")
     full_name: str
+    # Фильмы персоны с ролями: id, title, imdb_rating, roles
+    films: list[dict] | None = None
+
+
+class PersonSuggest(Model):
+    id: str = Field(..., alias="uuid")
+    full_name: str
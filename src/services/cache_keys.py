@@ -0,0 +1,69 @@
+import hashlib
+from functools import lru_cache
+
+import orjson
+
+from core.config import settings
+
+# Значения длиннее или с разделителем ключа попадают в ключ хешем
+MAX_VALUE_LENGTH = 64
+SEPARATOR = ':'
+
+
+@lru_cache()
+def model_version(model) -> str:
+    # Хеш схемы модели: после изменения полей старые записи просто
+    # перестают читаться, а не падают при разборе
+    schema = orjson.dumps([settings.CACHE_KEY_VERSION, model.schema()],
+                          option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(schema, digest_size=4).hexdigest()
+
+
+def namespace(index: str, model) -> str:
+    # movies:Film.1a2b3c4d
+    return f'{index}:{model.__name__}.{model_version(model)}'
+
+
+def _hash(value: str) -> str:
+    return '#' + hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+
+def normalize(value) -> str | None:
+    """
+    Значение параметра в ключе: None и пустые строки не влияют на ключ,
+    пробелы в строках схлопываются, списки кодируются JSON. Длинные
+    значения и значения с ':' заменяются хешем, поэтому разные наборы
+    параметров не могут дать один ключ.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = ' '.join(value.split())
+        if not value:
+            return None
+    elif isinstance(value, bool):
+        value = 'true' if value else 'false'
+    elif isinstance(value, (int, float)):
+        value = str(value)
+    else:
+        value = orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode()
+    if len(value) > MAX_VALUE_LENGTH or SEPARATOR in value or \
+            value.startswith('#'):
+        return _hash(value)
+    return value
+
+
+def entity_key(index: str, model, _id: str) -> str:
+    # movies:Film.1a2b3c4d:id:<uuid>
+    return f'{namespace(index, model)}:id:{normalize(_id)}'
+
+
+def list_key(index: str, model, params: dict = None) -> str:
+    # movies:FilmShort.1a2b3c4d:list:page:1:size:50:sort:-imdb_rating -
+    # параметры по алфавиту, порядок в запросе на ключ не влияет
+    parts = [namespace(index, model), 'list']
+    for name, value in sorted((params or {}).items()):
+        value = normalize(value)
+        if value is not None:
+            parts.extend([name, value])
+    return SEPARATOR.join(parts)
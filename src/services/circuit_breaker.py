@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+from elasticsearch import TransportError
+
+from core import metrics
+from core.config import settings
+from services import load_shedding
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ElasticUnavailableError(Exception):
+    # Elasticsearch не ответил; retry_after - через сколько секунд
+    # имеет смысл повторить запрос
+    def __init__(self, retry_after: float = 0):
+        super().__init__('Elasticsearch is unavailable')
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ElasticUnavailableError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Размыкает цепь после `failure_threshold` ошибок или медленных ответов
+    подряд: следующие `reset_timeout` секунд запросы в ES не уходят,
+    а сразу получают CircuitOpenError. Затем один пробный запрос решает,
+    замкнуть цепь или снова разомкнуть.
+    """
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 10,
+                 call_timeout: float = 2,
+                 slow_call: float = 1,
+                 enabled: bool = True):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Дольше call_timeout запрос не ждём, дольше slow_call - считаем
+        # медленным; 0 - без ограничения
+        self.call_timeout = call_timeout
+        self.slow_call = slow_call
+        self.enabled = enabled
+        self.state = CLOSED
+        self.stats = Counter()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.enabled and self.state == OPEN and \
+            self.retry_after() > 0
+
+    def retry_after(self) -> float:
+        return max(0.0,
+                   self._opened_at + self.reset_timeout - time.monotonic())
+
+    async def call(self, fetch: Callable[[], Awaitable]):
+        if not self.enabled:
+            return await load_shedding.bounded(fetch())
+
+        # Ждём не дольше call_timeout и не дольше срока самого запроса
+        timeout = self.call_timeout or None
+        left = load_shedding.remaining()
+        by_deadline = left is not None and (timeout is None or left < timeout)
+        if by_deadline:
+            if left <= 0:
+                raise load_shedding.DeadlineExceededError()
+            timeout = left
+
+        probe = self._acquire()
+        started = time.monotonic()
+        try:
+            if timeout:
+                res = await asyncio.wait_for(fetch(), timeout)
+            else:
+                res = await fetch()
+        except asyncio.TimeoutError:
+            if not by_deadline:
+                self._on_failure()
+                raise ElasticUnavailableError(self.retry_after()) from None
+            # Истёк срок запроса: сбоем ES это считаем, только если
+            # ответ уже успел стать медленным
+            if self.slow_call and time.monotonic() - started > self.slow_call:
+                self.stats['slow'] += 1
+                self._on_failure()
+            raise load_shedding.DeadlineExceededError() from None
+        except TransportError as exc:
+            # 4xx (в том числе NotFoundError) - ES ответил, это не сбой
+            if isinstance(exc.status_code, int) and exc.status_code < 500:
+                self._on_success()
+                raise
+            self._on_failure()
+            raise ElasticUnavailableError(self.retry_after()) from exc
+        finally:
+            if probe:
+                self._probing = False
+
+        if self.slow_call and time.monotonic() - started > self.slow_call:
+            self.stats['slow'] += 1
+            self._on_failure()
+        else:
+            self._on_success()
+        return res
+
+    def _acquire(self) -> bool:
+        # True, если этот вызов - пробный в полуоткрытом состоянии
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError(self.retry_after())
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probing:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError(self.reset_timeout)
+            self._probing = True
+            self.stats['probes'] += 1
+            return True
+        return False
+
+    # Ответы запросов, ушедших до размыкания, состояние OPEN не меняют
+    def _on_success(self):
+        if self.state != OPEN:
+            self._failures = 0
+            self.state = CLOSED
+
+    def _on_failure(self):
+        self.stats['failures'] += 1
+        if self.state == OPEN:
+            return
+        self._failures += 1
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self.stats['opened'] += 1
+
+
+@lru_cache()
+def get_breaker() -> CircuitBreaker:
+    # Один выключатель на воркер: кластер ES у всех сервисов общий
+    breaker = CircuitBreaker(settings.ES_BREAKER_FAILURE_THRESHOLD,
+                             settings.ES_BREAKER_RESET_TIMEOUT,
+                             settings.ES_BREAKER_CALL_TIMEOUT,
+                             settings.ES_BREAKER_SLOW_CALL,
+                             settings.ES_BREAKER_ENABLED)
+    metrics.stats_collector.track('circuit_breaker', 'elastic', breaker)
+    return breaker
@@ -0,0 +1,124 @@
+import zlib
+from typing import Callable
+
+import msgpack
+import orjson
+
+from core.config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Запись в кеше: версия формата, сериализатор, сжатие, затем данные.
+# Читается любая запись независимо от текущих настроек, поэтому их можно
+# менять без сброса кеша
+VERSION = b'\x01'
+# Записи до появления версии: j/z и JSON или голый JSON документа
+LEGACY_PLAIN = b'j'
+LEGACY_COMPRESSED = b'z'
+LEGACY_DOCUMENT = b'{'
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.decompress(data)
+
+
+def _lz4_compress(data: bytes) -> bytes:
+    return lz4.frame.compress(data)
+
+
+def _lz4_decompress(data: bytes) -> bytes:
+    return lz4.frame.decompress(data)
+
+
+# Имя: (маркер, функция, обратная функция, установлен ли пакет)
+SERIALIZERS: dict[str, tuple[bytes, Callable, Callable, bool]] = {
+    'orjson': (b'j', orjson.dumps, orjson.loads, True),
+    'msgpack': (b'm', msgpack.packb, msgpack.unpackb, True)}
+COMPRESSORS: dict[str, tuple[bytes, Callable, Callable, bool]] = {
+    'none': (b'-', None, None, True),
+    'zlib': (b'z', zlib.compress, zlib.decompress, True),
+    'zstd': (b's', _zstd_compress, _zstd_decompress, zstandard is not None),
+    'lz4': (b'4', _lz4_compress, _lz4_decompress, lz4 is not None)}
+_SERIALIZERS_BY_MARKER = {marker: (name, loads)
+                          for name, (marker, _, loads, _) in
+                          SERIALIZERS.items()}
+_COMPRESSORS_BY_MARKER = {marker: (name, decompress)
+                          for name, (marker, _, decompress, _) in
+                          COMPRESSORS.items()}
+
+
+def _check(kind: str, options: dict, name: str):
+    if name not in options:
+        raise ValueError(f'Unknown cache {kind} {name!r}, '
+                         f'expected one of {sorted(options)}')
+    if not options[name][3]:
+        raise RuntimeError(f'Cache {kind} {name!r} is not installed')
+
+
+class Codec:
+    """
+    Кодирует значения для Redis: сериализует `serializer` и сжимает
+    `compression` записи от `compress_threshold` байт (0 - не сжимать).
+    На маленьких записях сжатие не окупается.
+    """
+    def __init__(self,
+                 serializer: str = 'orjson',
+                 compression: str = 'zlib',
+                 compress_threshold: int = 0):
+        _check('serializer', SERIALIZERS, serializer)
+        _check('compression', COMPRESSORS, compression)
+        self.serializer = serializer
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+
+    def dumps(self, value) -> bytes:
+        marker, serialize, _, _ = SERIALIZERS[self.serializer]
+        data = serialize(value)
+        compression, compress, _, _ = COMPRESSORS['none']
+        if self.compress_threshold and len(data) >= self.compress_threshold:
+            compression, compress, _, _ = COMPRESSORS[self.compression]
+        if compress:
+            data = compress(data)
+        return VERSION + marker + compression + data
+
+    @staticmethod
+    def loads(data: bytes):
+        marker = data[:1]
+        if marker == VERSION:
+            serializer, compression = data[1:2], data[2:3]
+            if serializer not in _SERIALIZERS_BY_MARKER or \
+                    compression not in _COMPRESSORS_BY_MARKER:
+                raise ValueError(
+                    f'Unknown cache entry format: {data[:3]!r}')
+            name, decompress = _COMPRESSORS_BY_MARKER[compression]
+            payload = data[3:]
+            if decompress:
+                _check('compression', COMPRESSORS, name)
+                payload = decompress(payload)
+            name, deserialize = _SERIALIZERS_BY_MARKER[serializer]
+            _check('serializer', SERIALIZERS, name)
+            return deserialize(payload)
+        if marker == LEGACY_PLAIN:
+            return orjson.loads(data[1:])
+        if marker == LEGACY_COMPRESSED:
+            return orjson.loads(zlib.decompress(data[1:]))
+        if marker == LEGACY_DOCUMENT:
+            return orjson.loads(data)
+        raise ValueError(f'Unknown cache entry format: {marker!r}')
+
+
+def get_codec(compress_threshold: int) -> Codec:
+    return Codec(settings.CACHE_SERIALIZER,
+                 settings.CACHE_COMPRESSION,
+                 compress_threshold)
@@ -5,11 +5,22 @@ from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
 from redis.asyncio import Redis
 
+from core.config import settings
 from db.elastic import get_elastic
 from db.redis import get_redis
-from models.films import Film
+from models.films import Film, FilmShort, FilmSuggest
+from services.memory_cache import get_l1_cache
 from services.service import IdRequestService, ListService
 
+# Поля фильма для списков и поиска
+FILM_LIST_SOURCE = ['id', 'title', 'imdb_rating']
+# Подсказкам при наборе хватает id и названия
+FILM_SUGGEST_SOURCE = ['id', 'title']
+# Для фильмов персоны дополнительно нужны id участников, чтобы найти роли
+PERSON_FILMS_SOURCE = FILM_LIST_SOURCE + ['actors.id',
+                                          'writers.id',
+                                          'directors.id']
+
 
 # get_film_service — это провайдер IdRequestService.
 # С помощью Depends он сообщает, что ему необходимы Redis и Elasticsearch
@@ -20,11 +31,28 @@ from services.service import IdRequestService, ListService
 def get_film_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic)) -> IdRequestService:
-    return IdRequestService(redis, elastic, Film)
+    return IdRequestService(redis, elastic, Film, get_l1_cache('movies'))
 
 
 @lru_cache()
 def get_film_list_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic)) -> ListService:
-    return ListService(redis, elastic, Film)
+    return ListService(redis, elastic, FilmShort, get_l1_cache('movies'),
+                       FILM_LIST_SOURCE)
+
+
+@lru_cache()
+def get_person_films_service(
+        redis: Redis = Depends(get_redis),
+        elastic: AsyncElasticsearch = Depends(get_elastic)) -> ListService:
+    return ListService(redis, elastic, Film, get_l1_cache('movies'),
+                       PERSON_FILMS_SOURCE)
+
+
+@lru_cache()
+def get_film_suggest_service(
+        redis: Redis = Depends(get_redis),
+        elastic: AsyncElasticsearch = Depends(get_elastic)) -> ListService:
+    return ListService(redis, elastic, FilmSuggest, get_l1_cache('suggest'),
+                       FILM_SUGGEST_SOURCE, settings.SUGGEST_CACHE_TTL)
@@ -2,23 +2,20 @@ from functools import lru_cache
 
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
-from redis.asyncio import Redis
 
+from core import metrics
+from core.config import settings
 from db.elastic import get_elastic
-from db.redis import get_redis
-from models.genres import Genre
-from services.service import IdRequestService, ListService
+from services import invalidation
+from services.genre_dictionary import INDEX, GenreDictionary
 
 
 @lru_cache()
-def get_genre_service(
-        redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic)) -> IdRequestService:
-    return IdRequestService(redis, elastic, Genre)
-
-
-@lru_cache()
-def get_genre_list_service(
-        redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic)) -> ListService:
-    return ListService(redis, elastic, Genre)
+def get_genre_dictionary(
+        elastic: AsyncElasticsearch = Depends(get_elastic)) -> GenreDictionary:
+    dictionary = GenreDictionary(elastic,
+                                 settings.GENRE_DICTIONARY_REFRESH_INTERVAL)
+    invalidation.subscribe(INDEX, dictionary.invalidate)
+    metrics.stats_collector.track('genre_dictionary', 'GenreDictionary',
+                                  dictionary)
+    return dictionary
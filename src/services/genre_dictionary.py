@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from elasticsearch import AsyncElasticsearch, NotFoundError
+
+from core import metrics
+from models.genres import Genre
+from services.circuit_breaker import ElasticUnavailableError, get_breaker
+
+logger = logging.getLogger(__name__)
+
+INDEX = 'genres'
+# Жанров единицы десятков, весь индекс читается одним запросом
+MAX_GENRES = 1000
+
+
+class GenreDictionary:
+    """
+    Все жанры в памяти воркера: детали и список жанров, названия жанров
+    фильма и проверка фильтра по жанру обходятся без Redis и ES.
+    Перечитывается из ES раз в `refresh_interval` секунд и сразу после
+    инвалидации индекса жанров.
+    """
+    def __init__(self, elastic: AsyncElasticsearch, refresh_interval: float):
+        self.elastic = elastic
+        self.refresh_interval = refresh_interval
+        self.breaker = get_breaker()
+        self.genres: dict[str, Genre] = {}
+        self.loaded_at: float | None = None
+        self.stats = Counter()
+        self._lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    async def refresh(self):
+        try:
+            with metrics.timer('es_search', INDEX):
+                docs = await self.breaker.call(
+                    lambda: self.elastic.search(
+                        index=INDEX,
+                        size=MAX_GENRES,
+                        sort=[{'id': {'order': 'asc'}}]))
+        except NotFoundError:
+            docs = {'hits': {'hits': []}}
+        except ElasticUnavailableError:
+            self.stats['refresh_failed'] += 1
+            raise
+        # Словарь заменяется целиком, читатели не видят его наполовину
+        self.genres = {genre.id: genre for genre in
+                       (Genre(**doc['_source'])
+                        for doc in docs['hits']['hits'])}
+        self.loaded_at = time.monotonic()
+        self.stats['refreshed'] += 1
+
+    async def load(self):
+        # Первый запрос до фонового обновления загружает словарь сам,
+        # одновременные запросы ждут одну загрузку
+        if self.loaded:
+            return
+        async with self._lock:
+            if not self.loaded:
+                await self.refresh()
+
+    def invalidate(self):
+        # Жанры изменились в ES: фоновая задача перечитает их сразу
+        self._changed.set()
+
+    async def run(self):
+        while True:
+            self._changed.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning('Genre dictionary refresh failed, '
+                               'keeping %s genres', len(self.genres),
+                               exc_info=True)
+            try:
+                await asyncio.wait_for(self._changed.wait(),
+                                       self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def get(self, _id: str) -> Genre | None:
+        await self.load()
+        return self.genres.get(_id)
+
+    async def get_many(self, ids: list[str]) -> list[Genre]:
+        await self.load()
+        return [self.genres[_id] for _id in ids if _id in self.genres]
+
+    async def all(self) -> list[Genre]:
+        await self.load()
+        return list(self.genres.values())
+
+    async def exists(self, _id: str) -> bool:
+        # Пока словарь не загрузился из-за недоступного ES, проверить
+        # жанр нечем: решает сам запрос списка, возможно из кеша
+        try:
+            await self.load()
+        except ElasticUnavailableError:
+            return True
+        self.stats['hit' if _id in self.genres else 'miss'] += 1
+        return _id in self.genres
+
+    def name(self, _id: str, default: str | None = None) -> str | None:
+        genre = self.genres.get(_id)
+        return genre.name if genre else default
+
+    def resolve(self, genres: list[dict] | None) -> list[dict] | None:
+        """
+        Жанры фильма с названиями из словаря, а не из копии в документе
+        фильма, которая отстаёт от индекса жанров до переиндексации.
+        Жанр, которого в словаре ещё нет (добавлен после обновления),
+        остаётся с названием из документа.
+        """
+        if not genres:
+            return genres
+        return [{**genre, 'name': self.name(genre.get('id'),
+                                            genre.get('name'))}
+                for genre in genres]
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from core.config import settings
+from services import memory_cache
+
+logger = logging.getLogger(__name__)
+
+# Теги документов, из которых собран ответ на текущий запрос.
+# Заполняется, только если запрос идёт через кеш ответов
+touched: ContextVar[set | None] = ContextVar('touched', default=None)
+# Кто ещё держит данные индекса в памяти воркера, кроме кеша L1
+_subscribers: dict[str, list[Callable[[], None]]] = {}
+
+
+def entity_tag(index: str, _id: str) -> str:
+    # Ключи страниц, в которые попал документ
+    return f'tag:{index}:{_id}'
+
+
+def list_tag(index: str) -> str:
+    # Все закешированные страницы индекса
+    return f'tag:{index}'
+
+
+def tags(index: str, ids: list[str], lists: bool = False) -> list[str]:
+    names = [entity_tag(index, _id) for _id in ids]
+    if lists:
+        names.append(list_tag(index))
+    return names
+
+
+def subscribe(index: str, callback: Callable[[], None]):
+    # callback вызывается в каждом воркере после инвалидации индекса
+    _subscribers.setdefault(index, []).append(callback)
+
+
+def touch(index: str, ids: list[str], lists: bool = False):
+    names = touched.get()
+    if names is not None:
+        names.update(tags(index, ids, lists))
+
+
+def tag(pipe, key: str, names: list[str], ttl: int):
+    """
+    Добавляет в pipeline запись ключа в теги его документов.
+    Теги - sorted set со временем истечения ключа в score: при каждой
+    записи из тега удаляются уже истёкшие ключи, иначе теги популярных
+    документов растут без ограничений.
+    """
+    now = time.time()
+    # Тег живёт не меньше самого долгого из ключей, которые в него пишут
+    tag_ttl = max([ttl, *settings.CACHE_TTL.values()])
+    for name in names:
+        pipe.zadd(name, {key: now + ttl})
+        pipe.expire(name, tag_ttl)
+        pipe.zremrangebyscore(name, '-inf', now)
+
+
+async def invalidate(redis: Redis,
+                     index: str,
+                     ids: list[str],
+                     lists: bool = False) -> list[str]:
+    """
+    Удаляет из Redis документы `ids` и страницы, в которые они попали.
+    `lists` сбрасывает все страницы индекса - нужно, когда документы
+    добавлены, удалены или изменились поля, по которым строятся списки.
+    Остальные воркеры узнают о сброшенных ключах через pub/sub.
+    """
+    tags = [entity_tag(index, _id) for _id in ids]
+    if lists:
+        tags.append(list_tag(index))
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for name in tags:
+            pipe.zrange(name, 0, -1)
+        members = await pipe.execute()
+
+    # В тегах и ключи документов (под ними же они лежат в памяти
+    # воркеров), и ключи страниц
+    keys = list(dict.fromkeys(member.decode()
+                              for tagged in members for member in tagged))
+    # Сообщение уходит и без ключей: жанры, например, в Redis не лежат,
+    # но хранятся в памяти воркеров
+    async with redis.pipeline(transaction=False) as pipe:
+        if keys:
+            pipe.delete(*keys, *tags)
+        pipe.publish(settings.CACHE_INVALIDATION_CHANNEL,
+                     orjson.dumps({'index': index, 'keys': keys}))
+        await pipe.execute()
+    return keys
+
+
+async def listen(redis: Redis):
+    # Сбрасывает записи кеша в памяти воркера по сообщениям invalidate
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+            while True:
+                # Ждём с таймаутом, а не блокирующим чтением: иначе сработает
+                # socket_timeout соединения и подписка оборвётся
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1)
+                if not message:
+                    continue
+                # Битое сообщение или упавший подписчик не должны
+                # останавливать слушателя: иначе кеш в памяти воркера
+                # перестанет сбрасываться до перезапуска
+                try:
+                    _drop(orjson.loads(message['data']))
+                except Exception:
+                    logger.exception('Cache invalidation message %r is '
+                                     'not handled', message['data'][:200])
+        except (ConnectionError, TimeoutError):
+            logger.warning('Cache invalidation channel is unavailable, '
+                           'retrying')
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.reset()
+
+
+def _drop(message: dict):
+    memory_cache.drop(message['keys'])
+    for callback in _subscribers.get(message.get('index'), ()):
+        callback()
@@ -0,0 +1,152 @@
+import asyncio
+import math
+import time
+from collections import Counter
+from contextvars import ContextVar
+from http import HTTPStatus
+from typing import Awaitable
+
+import orjson
+
+from core import metrics
+from core.config import settings
+
+# Момент (по time.monotonic), к которому запрос должен быть обработан;
+# None - без ограничения
+deadline: ContextVar[float | None] = ContextVar('deadline', default=None)
+
+
+class DeadlineExceededError(Exception):
+    def __init__(self):
+        super().__init__('Request deadline exceeded')
+
+
+def remaining() -> float | None:
+    at = deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check():
+    # Перед запросами, которые нельзя безопасно отменить на середине
+    # (команды Redis): не начинать их после срока
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError()
+
+
+def detach():
+    # Фоновые задачи копируют контекст запроса, но его срок на них
+    # распространяться не должен
+    deadline.set(None)
+
+
+async def bounded(awaitable: Awaitable):
+    # Ждём не дольше, чем осталось до срока запроса; по истечении
+    # awaitable отменяется
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceededError()
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError() from None
+
+
+class ConcurrencyLimiter:
+    # Не больше `limit` одновременных запросов к эндпоинту в воркере
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.stats = Counter()
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self, timeout: float) -> bool:
+        try:
+            if timeout > 0:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            elif self._semaphore.locked():
+                raise asyncio.TimeoutError()
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            return False
+        self.active += 1
+        self.stats['admitted'] += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class LoadSheddingMiddleware:
+    """
+    Ограничивает число одновременных запросов к тяжёлым эндпоинтам
+    (CONCURRENCY_LIMITS) и задаёт каждому запросу срок (REQUEST_TIMEOUT).
+    Не дождавшийся очереди запрос получает 429, не уложившийся в срок -
+    503; срок передаётся в запросы к ES и Redis через `deadline`.
+    Эндпоинт определяет MetricsMiddleware, поэтому этот middleware
+    должен стоять внутри него.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.limiters: dict[str, ConcurrencyLimiter] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        path = metrics.endpoint.get()
+        timeout = settings.REQUEST_TIMEOUTS.get(path, settings.REQUEST_TIMEOUT)
+        limiter = self._limiter(path)
+        if limiter and not await limiter.acquire(
+                settings.CONCURRENCY_QUEUE_TIMEOUT):
+            return await self._reject(send, HTTPStatus.TOO_MANY_REQUESTS,
+                                      'Too many concurrent requests')
+
+        started = {'value': False}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                started['value'] = True
+            await send(message)
+
+        token = deadline.set(time.monotonic() + timeout if timeout else None)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except DeadlineExceededError:
+            if started['value']:
+                raise
+            await self._reject(send, HTTPStatus.SERVICE_UNAVAILABLE,
+                               'Request deadline exceeded')
+        finally:
+            deadline.reset(token)
+            if limiter:
+                limiter.release()
+
+    def _limiter(self, path: str) -> ConcurrencyLimiter | None:
+        limit = settings.CONCURRENCY_LIMITS.get(path)
+        if not limit:
+            return None
+        limiter = self.limiters.get(path)
+        if limiter is None:
+            limiter = self.limiters[path] = ConcurrencyLimiter(limit)
+            metrics.stats_collector.track('concurrency_limiter', path,
+                                          limiter)
+        return limiter
+
+    @staticmethod
+    async def _reject(send, status: HTTPStatus, detail: str):
+        body = orjson.dumps({'detail': detail})
+        retry_after = max(1, math.ceil(settings.REQUEST_TIMEOUT))
+        await send({'type': 'http.response.start',
+                    'status': int(status),
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'retry-after', str(retry_after).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,70 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Optional
+
+from core.config import settings
+
+
+class LRUCache:
+    """
+    Кеш уже распарсенных объектов в памяти воркера перед Redis.
+    Ограничен по числу записей (вытесняются давно не используемые)
+    и по времени жизни записи.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = Counter()
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.stats['miss'] += 1
+            return None
+
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.stats['expired'] += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.stats['hit'] += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Все кеши воркера, чтобы сбрасывать в них записи при инвалидации
+_caches: list[LRUCache] = []
+
+
+def get_l1_cache(index: str) -> LRUCache | None:
+    # Для индекса без TTL в настройках кеш в памяти не используется
+    ttl = settings.L1_CACHE_TTL.get(index)
+    if not settings.L1_CACHE_ENABLED or not ttl:
+        return None
+    cache = LRUCache(settings.L1_CACHE_SIZE, ttl)
+    _caches.append(cache)
+    return cache
+
+
+def drop(keys: list[str]):
+    for cache in _caches:
+        for key in keys:
+            cache.delete(key)
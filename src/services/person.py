@@ -4,21 +4,35 @@ from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 from redis.asyncio import Redis
 
+from core.config import settings
 from db.elastic import get_elastic
 from db.redis import get_redis
-from models.persons import Person
+from models.persons import Person, PersonSuggest
+from services.memory_cache import get_l1_cache
 from services.service import IdRequestService, ListService
 
+# Подсказкам при наборе хватает id и имени, без фильмов персоны
+PERSON_SUGGEST_SOURCE = ['id', 'full_name']
+
 
 @lru_cache()
 def get_person_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic)) -> IdRequestService:
-    return IdRequestService(redis, elastic, Person)
+    return IdRequestService(redis, elastic, Person, get_l1_cache('persons'))
 
 
 @lru_cache()
 def get_person_list_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic)) -> ListService:
-    return ListService(redis, elastic, Person)
\ No newline at end of file
+    return ListService(redis, elastic, Person, get_l1_cache('persons'))
+
+
+@lru_cache()
+def get_person_suggest_service(
+        redis: Redis = Depends(get_redis),
+        elastic: AsyncElasticsearch = Depends(get_elastic)) -> ListService:
+    return ListService(redis, elastic, PersonSuggest,
+                       get_l1_cache('suggest'),
+                       PERSON_SUGGEST_SOURCE, settings.SUGGEST_CACHE_TTL)
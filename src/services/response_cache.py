@@ -0,0 +1,178 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode
+
+import orjson
+
+import core.config as conf
+from core import metrics
+from core.config import settings
+from db import redis
+from services import invalidation
+from services.memory_cache import get_l1_cache
+
+PREFIX = '/api/v1/'
+# Служебные эндпоинты и жанры, которые и так отдаются из памяти
+# воркера, в кеш ответов не попадают
+EXCLUDED = ('/api/v1/cache/', '/api/v1/genres/')
+NEXT_PAGE_TOKEN = conf.NEXT_PAGE_TOKEN_HEADER.lower().encode()
+
+
+def cache_key(scope) -> str:
+    # Порядок и пустые значения параметров на ключ не влияют
+    query = urlencode(sorted(parse_qsl(scope['query_string'].decode())))
+    return f'response:{scope["path"]}?{query}' if query \
+        else f'response:{scope["path"]}'
+
+
+def etag(body: bytes) -> bytes:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'.encode()
+
+
+def etag_matches(if_none_match: bytes | None, tag: bytes) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == b'*':
+        return True
+    # Слабое сравнение: W/"..." совпадает с "..."
+    return any(value.strip().removeprefix(b'W/') == tag
+               for value in if_none_match.split(b','))
+
+
+def _dumps(tag: bytes, headers: list, body: bytes) -> bytes:
+    # ETag первой строкой, чтобы ответить 304 без разбора записи,
+    # затем заголовки в JSON и тело ответа как есть
+    return tag + b'\n' + \
+        orjson.dumps([[k.decode(), v.decode()] for k, v in headers]) + \
+        b'\n' + body
+
+
+def _loads(data: bytes) -> tuple[list, bytes]:
+    _, head, body = data.split(b'\n', 2)
+    return [(k.encode(), v.encode()) for k, v in orjson.loads(head)], body
+
+
+def _conditional(headers: list) -> list:
+    # 304 несёт только валидатор и политику кеширования
+    return [(k, v) for k, v in headers if k in (b'etag', b'cache-control')]
+
+
+class ResponseCacheMiddleware:
+    """
+    Кеш готовых ответов GET-эндпоинтов API: при попадании ответ уходит
+    одним GET из Redis (или из памяти воркера), без сервисов и моделей.
+    Ключ записывается в теги документов, из которых собран ответ, поэтому
+    инвалидация по тегам сбрасывает и его.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.l1 = get_l1_cache('responses')
+
+    async def __call__(self, scope, receive, send):
+        if not self._cacheable(scope):
+            return await self.app(scope, receive, send)
+
+        key = cache_key(scope)
+        if_none_match = dict(scope['headers']).get(b'if-none-match')
+        entry = self.l1.get(key) if self.l1 is not None else None
+        if entry is None:
+            data = await redis.redis.get(key)
+            # Запись без ETag в первой строке - старого формата, промах
+            if data and data[:1] == b'"':
+                tag = data[:data.index(b'\n')]
+                if etag_matches(if_none_match, tag):
+                    metrics.cache_event('response', 'not_modified')
+                    return await self._send_not_modified(
+                        send, [(b'etag', tag), self._cache_control()])
+                entry = _loads(data)
+                self._put_to_memory(key, entry)
+        metrics.cache_event('response', 'hit' if entry else 'miss')
+        if entry:
+            return await self._send(send, *entry, if_none_match)
+
+        await self._fetch(key, scope, receive, send, if_none_match)
+
+    @staticmethod
+    def _cacheable(scope) -> bool:
+        return settings.RESPONSE_CACHE_ENABLED and \
+            scope['type'] == 'http' and scope['method'] == 'GET' and \
+            scope['path'].startswith(PREFIX) and \
+            not scope['path'].startswith(EXCLUDED)
+
+    async def _fetch(self, key: str, scope, receive, send,
+                     if_none_match: bytes = None):
+        start = {}
+        chunks = []
+
+        async def capture(message):
+            # Копим только успешный JSON-ответ, остальное отдаём как есть
+            if message['type'] == 'http.response.start':
+                headers = dict(message['headers'])
+                if message['status'] == 200 and \
+                        headers.get(b'content-type') == b'application/json':
+                    start.update(message)
+                    return
+            elif start:
+                chunks.append(message.get('body', b''))
+                return
+            await send(message)
+
+        names = set()
+        token = invalidation.touched.set(names)
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            invalidation.touched.reset(token)
+        if not start:
+            return
+
+        body = b''.join(chunks)
+        headers = [(k, v) for k, v in start['headers']
+                   if k != b'content-length']
+        tag = etag(body)
+        # Токен с point-in-time живёт недолго и не должен достаться другим
+        # ни из нашего кеша, ни из кеша nginx
+        shareable = not (settings.PAGINATION_USE_PIT and
+                         any(k == NEXT_PAGE_TOKEN for k, _ in headers))
+        headers += [(b'etag', tag), self._cache_control(shareable)]
+        if shareable:
+            await self._put_to_cache(key, tag, headers, body, names)
+        await self._send(send, headers, body, if_none_match)
+
+    @staticmethod
+    def _cache_control(shareable: bool = True) -> tuple[bytes, bytes]:
+        if not shareable:
+            return b'cache-control', b'private, no-store'
+        return (b'cache-control',
+                f'public, max-age={settings.RESPONSE_CACHE_MAX_AGE}'.encode())
+
+    async def _put_to_cache(self, key: str, tag: bytes, headers: list,
+                            body: bytes, names: set):
+        ttl = settings.RESPONSE_CACHE_TTL
+        async with redis.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, _dumps(tag, headers, body), ttl)
+            invalidation.tag(pipe, key, list(names), ttl)
+            await pipe.execute()
+        self._put_to_memory(key, (headers, body))
+
+    def _put_to_memory(self, key: str, entry: tuple):
+        if self.l1 is not None:
+            self.l1.set(key, entry)
+
+    @classmethod
+    async def _send(cls, send, headers: list, body: bytes,
+                    if_none_match: bytes = None):
+        if etag_matches(if_none_match, dict(headers)[b'etag']):
+            metrics.cache_event('response', 'not_modified')
+            return await cls._send_not_modified(send, _conditional(headers))
+        await send({'type': 'http.response.start',
+                    'status': 200,
+                    'headers': [*headers,
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _send_not_modified(send, headers: list):
+        await send({'type': 'http.response.start',
+                    'status': 304,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''})
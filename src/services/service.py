@@ -1,52 +1,287 @@
-from typing import Optional
+import logging
+from functools import partial
+from typing import AsyncIterator, Optional
 
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from core import metrics
+from core.config import settings
+from services import cache_keys, codec, invalidation, load_shedding
+from services.circuit_breaker import get_breaker
+from services.memory_cache import LRUCache
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
 
 CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
 ES_MAX_SIZE = 100
 
 
-class IdRequestService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch, model):
+def _cache_ttl(index: str) -> int:
+    return settings.CACHE_TTL.get(index, CACHE_EXPIRE_IN_SECONDS)
+
+
+def _is_stale(index: str, ttl) -> bool:
+    # Возраст записи считаем по оставшемуся TTL ключа: записана она
+    # с полным _cache_ttl, мягкий TTL отсчитывается от того же момента
+    soft_ttl = settings.CACHE_SOFT_TTL.get(index)
+    if not soft_ttl or not isinstance(ttl, int) or ttl < 0:
+        return False
+    return _cache_ttl(index) - ttl >= soft_ttl
+
+
+def _loads(data: bytes) -> Optional:
+    # Нечитаемая запись (неизвестный формат, нет zstandard или lz4 у
+    # этого воркера, битые данные) - промах: значение перечитается из ES
+    # и перезапишется текущим кодеком
+    try:
+        return codec.Codec.loads(data)
+    except Exception:
+        metrics.cache_event('codec', 'decode_error')
+        logger.warning('Cache entry %r... is not decodable', data[:3],
+                       exc_info=True)
+        return None
+
+
+async def _get_with_ttl(redis: Redis, keys: list[str]) -> list[tuple]:
+    # Значения и оставшиеся TTL ключей за один проход по сети
+    load_shedding.check()
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.get(key)
+            pipe.ttl(key)
+        res = await pipe.execute(raise_on_error=False)
+    return list(zip(res[::2], res[1::2]))
+
+
+def _get_single_flight(redis: Redis) -> SingleFlight:
+    return SingleFlight(redis,
+                        settings.SINGLE_FLIGHT_MODE,
+                        settings.SINGLE_FLIGHT_LOCK_TIMEOUT,
+                        settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+
+class Page(list):
+    # Страница результатов и значения сортировки последнего документа
+    # для search_after
+    def __init__(self, items=(), after: list = None, pit_id: str = None):
+        super().__init__(items)
+        self.after = after
+        self.pit_id = pit_id
+
+
+class MemoryCacheMixin:
+    l1: LRUCache | None = None
+
+    def _get_from_memory(self, key: str) -> Optional:
+        return self.l1.get(key) if self.l1 is not None else None
+
+    def _put_to_memory(self, key: str, value):
+        if self.l1 is not None and value:
+            self.l1.set(key, value)
+
+
+class IdRequestService(MemoryCacheMixin):
+    def __init__(self,
+                 redis: Redis,
+                 elastic: AsyncElasticsearch,
+                 model,
+                 l1: LRUCache = None):
         self.redis = redis
         self.elastic = elastic
         self.model = model
+        self.l1 = l1
+        self.codec = codec.get_codec(settings.CACHE_COMPRESS_THRESHOLD)
+        self.flight = _get_single_flight(redis)
+        self.breaker = get_breaker()
+        _track(self)
 
     async def get_by_id(self, _id: str, index: str) -> Optional:
-        entity = await self._get_from_cache(_id)
+        memory_key = self._key(_id, index)
+        family = metrics.key_family(None, index)
+        entity = self._get_from_memory(memory_key)
+        if entity:
+            metrics.cache_event(family, 'memory_hit')
+            invalidation.touch(index, [_id])
+            return entity
+
+        (entity, stale), = await self._get_many_from_cache([_id], index)
+        metrics.cache_event(family, 'hit' if entity else 'miss')
+        if stale and not self.breaker.is_open:
+            # После мягкого TTL отдаём запись сразу, а обновляет её
+            # из ES одна фоновая задача. При разомкнутой цепи просто
+            # отдаём устаревшую запись
+            metrics.cache_event(family, 'stale')
+            self.flight.refresh(memory_key,
+                                lambda: self._refresh([_id], index),
+                                lambda: self._probe(_id, index))
         if not entity:
-            entity = await self._get_from_elastic(_id, index)
-            if not entity:
-                return None
-            await self._put_to_cache(entity)
+            # Одновременные промахи по одному id ждут один запрос в ES
+            # Запрос ждёт загрузку не дольше своего срока, сама загрузка
+            # идёт без срока и продолжается для остальных
+            entity = await load_shedding.bounded(self.flight.do(
+                memory_key,
+                lambda: self._load(_id, index),
+                lambda: self._probe(_id, index)))
 
+        self._put_to_memory(memory_key, entity)
+        invalidation.touch(index, [_id])
         return entity
 
+    async def _load(self, _id: str, index: str) -> Optional:
+        # Общая загрузка создаётся в контексте первого запроса; каждый
+        # ожидающий ограничен своим сроком через bounded()
+        load_shedding.detach()
+        entity = await self._get_from_elastic(_id, index)
+        if entity:
+            await self._put_to_cache(entity, index)
+        return entity
+
+    async def _refresh(self, ids: list[str], index: str) -> list:
+        load_shedding.detach()
+        entities = await self._get_many_from_elastic(ids, index)
+        await self._put_many_to_cache(entities, index)
+        for entity in entities:
+            self._put_to_memory(self._key(entity.id, index), entity)
+        return entities
+
+    async def get_many(self, ids: list[str], index: str) -> list:
+        # Один MGET в Redis и один mget в Elasticsearch на весь набор id
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        for _id in ids:
+            entity = self._get_from_memory(self._key(_id, index))
+            if entity:
+                found[_id] = entity
+
+        family = metrics.key_family(None, index)
+        metrics.cache_event(family, 'memory_hit', len(found))
+        rest = [_id for _id in ids if _id not in found]
+        if rest:
+            cached = await self._get_many_from_cache(rest, index)
+            stale = [_id for _id, (entity, is_stale) in zip(rest, cached)
+                     if entity and is_stale]
+            for _id, (entity, _) in zip(rest, cached):
+                if entity:
+                    found[_id] = entity
+            if stale and not self.breaker.is_open:
+                metrics.cache_event(family, 'stale', len(stale))
+                self.flight.refresh(
+                    self._key(','.join(stale), index),
+                    lambda: self._refresh(stale, index))
+
+        missed = [_id for _id in ids if _id not in found]
+        metrics.cache_event(family, 'hit', len(rest) - len(missed))
+        metrics.cache_event(family, 'miss', len(missed))
+        if missed:
+            entities = await self._get_many_from_elastic(missed, index)
+            await self._put_many_to_cache(entities, index)
+            found.update({entity.id: entity for entity in entities})
+
+        for _id, entity in found.items():
+            self._put_to_memory(self._key(_id, index), entity)
+        invalidation.touch(index, list(found))
+        return [found[_id] for _id in ids if _id in found]
+
     async def _get_from_elastic(self, _id: str, index: str) -> Optional:
         try:
-            doc = await self.elastic.get(index=index, id=_id)
+            with metrics.timer('es_get', index):
+                doc = await self.breaker.call(
+                    lambda: self.elastic.get(index=index, id=_id))
         except NotFoundError:
             return None
         return self.model(**doc['_source'])
 
-    async def _get_from_cache(self, _id: str) -> Optional:
-        data = await self.redis.get(_id)
+    async def _get_many_from_elastic(self, ids: list[str], index: str) -> list:
+        try:
+            with metrics.timer('es_mget', index):
+                docs = await self.breaker.call(
+                    lambda: self.elastic.mget(body={'ids': ids}, index=index))
+        except NotFoundError:
+            return []
+        return [self.model(**doc['_source'])
+                for doc in docs['docs'] if doc.get('found')]
+
+    async def _probe(self, _id: str, index: str) -> Optional:
+        # Опрос кеша внутри общей загрузки (SINGLE_FLIGHT_MODE=redis)
+        load_shedding.detach()
+        return await self._get_from_cache(_id, index)
+
+    async def _get_from_cache(self, _id: str, index: str = '') -> Optional:
+        load_shedding.check()
+        with metrics.timer('redis_get', index):
+            data = await self.redis.get(self._key(_id, index))
         if not data:
             return None
 
-        res = self.model.parse_raw(data)
+        with metrics.timer('decode', index):
+            res = self._decode(data)
         return res
 
-    async def _put_to_cache(self, entity):
-        await self.redis.set(entity.id, entity.json(), CACHE_EXPIRE_IN_SECONDS)
+    async def _get_many_from_cache(self, ids: list[str],
+                                   index: str = '') -> list[tuple]:
+        # Пары (объект, устарел ли он по мягкому TTL)
+        with metrics.timer('redis_get', index):
+            data = await _get_with_ttl(
+                self.redis, [self._key(_id, index) for _id in ids])
+        with metrics.timer('decode', index):
+            return [(self._decode(item), _is_stale(index, ttl))
+                    if isinstance(item, bytes) else (None, False)
+                    for item, ttl in data]
+
+    async def _put_to_cache(self, entity, index: str = ''):
+        await self._put_many_to_cache([entity], index)
+
+    async def _put_many_to_cache(self, entities: list, index: str = ''):
+        if not entities:
+            return
+        ttl = _cache_ttl(index)
+        with metrics.timer('redis_set', index):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for entity in entities:
+                    key = self._key(entity.id, index)
+                    pipe.set(key, self._encode(entity), ttl)
+                    # Через тег документа invalidate находит его ключ,
+                    # не зная модели сервиса
+                    invalidation.tag(pipe, key, invalidation.tags(
+                        index, [entity.id]), ttl)
+                await pipe.execute()
+
+    def _key(self, _id: str, index: str) -> str:
+        # Ключ и в Redis, и в памяти воркера
+        return cache_keys.entity_key(index, self.model, _id)
+
+    def _encode(self, entity) -> bytes:
+        return self.codec.dumps(entity.dict())
+
+    def _decode(self, data: bytes):
+        # Записи entity.json() до появления кодеков codec тоже читает
+        value = _loads(data)
+        return self.model(**value) if value is not None else None
 
 
-class ListService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch, model):
+class ListService(MemoryCacheMixin):
+    def __init__(self,
+                 redis: Redis,
+                 elastic: AsyncElasticsearch,
+                 model,
+                 l1: LRUCache = None,
+                 source: list[str] = None,
+                 ttl: int = None):
         self.redis = redis
         self.elastic = elastic
         self.model = model
+        self.l1 = l1
+        # Поля _source, которые нужны модели; None - документ целиком
+        self.source = source
+        self.codec = codec.get_codec(settings.LIST_CACHE_COMPRESS_THRESHOLD)
+        # Время жизни страниц в Redis; None - CACHE_TTL индекса
+        self.ttl = ttl
+        self.flight = _get_single_flight(redis)
+        self.breaker = get_breaker()
+        _track(self)
 
     async def get_list(self,
                        index: str,
@@ -54,75 +289,425 @@ class ListService:
                        search: dict = None,
                        key: str = None,
                        page: int = None,
-                       size: int = None) -> Optional:
+                       size: int = None,
+                       search_after: list = None,
+                       pit: str = None) -> Optional:
+        # Страницы внутри point-in-time не кешируем: pit id у каждого свой
+        if not key or pit:
+            entities = await self._get_from_elastic(index, sort, search, page,
+                                                    size, search_after, pit)
+            _touch(index, entities)
+            return entities
 
-        if key:
-            entities = await self._get_from_cache(key)
-        else:
-            entities = None
+        family = metrics.key_family(key, index)
+        entities = self._get_from_memory(key)
+        if entities:
+            metrics.cache_event(family, 'memory_hit')
+            _touch(index, entities)
+            return entities
+
+        (entities, stale), = await self._get_many_from_cache([key], index)
+        metrics.cache_event(family, 'hit' if entities else 'miss')
+        if stale and not self.breaker.is_open:
+            metrics.cache_event(family, 'stale')
+            self.flight.refresh(
+                key,
+                lambda: self._refresh(key, index, sort, search, page, size,
+                                      search_after),
+                lambda: self._probe(key, index))
         if not entities:
-            entities = await self._get_from_elastic(index,
-                                                    sort,
-                                                    search,
-                                                    page,
-                                                    size)
-            if not entities:
-                return None
-            if key:
-                await self._put_to_cache(key, entities)
+            entities = await load_shedding.bounded(self.flight.do(
+                key,
+                lambda: self._load(key, index, sort, search, page, size,
+                                   search_after),
+                lambda: self._probe(key, index)))
+
+        self._put_to_memory(key, entities)
+        _touch(index, entities)
+        return entities
+
+    async def _load(self,
+                    key: str,
+                    index: str,
+                    sort: str = None,
+                    search: dict = None,
+                    page: int = None,
+                    size: int = None,
+                    search_after: list = None) -> Optional:
+        # Срок первого запроса на общую загрузку не распространяется
+        load_shedding.detach()
+        entities = await self._get_from_elastic(index, sort, search, page,
+                                                size, search_after)
+        if entities:
+            await self._put_to_cache(key, entities, index)
+        return entities
 
+    async def _refresh(self, key: str, *args) -> Optional:
+        entities = await self._load(key, *args)
+        self._put_to_memory(key, entities)
         return entities
 
+    async def get_aggs(self,
+                       index: str,
+                       aggs: dict,
+                       search: dict = None,
+                       key: str = None) -> Optional[dict]:
+        # Агрегации кешируются так же, как страницы: память воркера,
+        # Redis с мягким TTL и один запрос в ES на ключ
+        if not key:
+            res = await self._get_aggs_from_elastic(index, aggs, search)
+            invalidation.touch(index, [], lists=True)
+            return res
+
+        family = metrics.key_family(key, index)
+        res = self._get_from_memory(key)
+        if res:
+            metrics.cache_event(family, 'memory_hit')
+            invalidation.touch(index, [], lists=True)
+            return res
+
+        (data, ttl), = await _get_with_ttl(self.redis, [key])
+        res = _loads(data) if isinstance(data, bytes) else None
+        metrics.cache_event(family, 'hit' if res else 'miss')
+        if res and self.ttl is None and _is_stale(index, ttl) and \
+                not self.breaker.is_open:
+            metrics.cache_event(family, 'stale')
+            self.flight.refresh(
+                key, lambda: self._refresh_aggs(key, index, aggs, search))
+        if not res:
+            res = await load_shedding.bounded(self.flight.do(
+                key, lambda: self._load_aggs(key, index, aggs, search)))
+
+        self._put_to_memory(key, res)
+        invalidation.touch(index, [], lists=True)
+        return res
+
+    async def _load_aggs(self,
+                         key: str,
+                         index: str,
+                         aggs: dict,
+                         search: dict = None) -> Optional[dict]:
+        load_shedding.detach()
+        res = await self._get_aggs_from_elastic(index, aggs, search)
+        if res is None:
+            return None
+        ttl = self.ttl or _cache_ttl(index)
+        with metrics.timer('redis_set', index):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, self.codec.dumps(res), ttl)
+                # Агрегации зависят от всех документов индекса, поэтому
+                # сбрасываются вместе со всеми страницами списков
+                invalidation.tag(pipe, key, invalidation.tags(
+                    index, [], lists=True), ttl)
+                await pipe.execute()
+        return res
+
+    async def _refresh_aggs(self, key: str, *args) -> Optional[dict]:
+        res = await self._load_aggs(key, *args)
+        self._put_to_memory(key, res)
+        return res
+
+    async def _get_aggs_from_elastic(self,
+                                     index: str,
+                                     aggs: dict,
+                                     search: dict = None) -> Optional[dict]:
+        try:
+            with metrics.timer('es_aggs', index):
+                docs = await self.breaker.call(
+                    lambda: self.elastic.search(index=index,
+                                                query=search,
+                                                size=0,
+                                                track_total_hits=True,
+                                                aggs=aggs))
+        except NotFoundError:
+            return None
+        return {'total': docs['hits']['total']['value'],
+                'aggregations': docs.get('aggregations', {})}
+
+    async def get_lists(self,
+                        index: str,
+                        searches: list[dict],
+                        keys: list[str] = None,
+                        sort: str = None,
+                        page: int = None,
+                        size: int = None) -> list[Optional]:
+        # Несколько списков за один поход в Redis и один msearch
+        # в Elasticsearch
+        if not keys:
+            results = [None] * len(searches)
+        else:
+            results = [self._get_from_memory(key) for key in keys]
+            in_memory = {i for i, entities in enumerate(results) if entities}
+            if len(in_memory) < len(keys):
+                cached = await self._get_many_from_cache(
+                    [key for i, key in enumerate(keys) if i not in in_memory],
+                    index)
+                rest = (i for i in range(len(keys)) if i not in in_memory)
+                for i, (entities, stale) in zip(rest, cached):
+                    results[i] = entities
+                    self._put_to_memory(keys[i], entities)
+                    if entities and stale and not self.breaker.is_open:
+                        metrics.cache_event(
+                            metrics.key_family(keys[i], index), 'stale')
+                        self.flight.refresh(
+                            keys[i],
+                            partial(self._refresh, keys[i], index, sort,
+                                    searches[i], page, size),
+                            partial(self._probe, keys[i], index))
+            for i, key in enumerate(keys):
+                event = 'memory_hit' if i in in_memory else \
+                    'hit' if results[i] else 'miss'
+                metrics.cache_event(metrics.key_family(key, index), event)
+
+        missed = [i for i, entities in enumerate(results) if not entities]
+        if missed:
+            fetched = await self._get_many_from_elastic(
+                index, [searches[i] for i in missed], sort, page, size)
+            for i, entities in zip(missed, fetched):
+                results[i] = entities
+            if keys:
+                await self._put_many_to_cache(
+                    {keys[i]: results[i] for i in missed if results[i]},
+                    index)
+                for i in missed:
+                    self._put_to_memory(keys[i], results[i])
+
+        for entities in results:
+            _touch(index, entities)
+        return results
+
     async def _get_from_elastic(self,
                                 index: str,
                                 sort: str = None,
                                 search: dict = None,
                                 page: int = None,
-                                size: int = None) -> Optional:
-        if sort:
-            try:
-                order = 'desc' if sort.startswith('-') else 'asc'
-                sort = sort[1:] if sort.startswith('-') else sort
-                sorting = [{sort: {'order': order}}]
-            except AttributeError:
-                sorting = None
-        else:
-            sorting = None
-
-        if page and size:
-            offset = (page * size) - size
-        elif page and not size:
-            size = ES_MAX_SIZE
-            offset = (page * size) - size
-        elif not page and size:
+                                size: int = None,
+                                search_after: list = None,
+                                pit: str = None) -> Optional:
+        sorting = _get_sorting(sort)
+        offset, size = _get_offset(page, size)
+        if search_after:
             offset = None
+
+        params = {}
+        if pit:
+            # Поиск внутри point-in-time идёт без указания индекса
+            params['pit'] = {'id': pit,
+                             'keep_alive': settings.PAGINATION_PIT_KEEP_ALIVE}
         else:
-            offset = None
-            size = ES_MAX_SIZE
+            params['index'] = index
+        if search_after:
+            params['search_after'] = search_after
+        if self.source:
+            params['_source_includes'] = self.source
 
         try:
-            docs = await self.elastic.search(
-                index=index,
-                query=search,
-                size=size,
-                sort=sorting,
-                from_=offset
-            )
+            with metrics.timer('es_search', index):
+                docs = await self.breaker.call(
+                    lambda: self.elastic.search(
+                        query=search,
+                        size=size,
+                        sort=sorting,
+                        from_=offset,
+                        **params
+                    ))
         except NotFoundError:
             return None
 
-        return [self.model(**doc['_source']) for doc in docs['hits']['hits']]
+        return self._to_page(docs)
 
-    async def _get_from_cache(self, name: str = None) -> Optional:
-        data = await self.redis.hgetall(name)
-        if not data:
+    async def open_pit(self, index: str) -> str:
+        res = await self.breaker.call(
+            lambda: self.elastic.open_point_in_time(
+                index=index, keep_alive=settings.PAGINATION_PIT_KEEP_ALIVE))
+        return res['id']
+
+    async def close_pit(self, pit: str):
+        try:
+            await self.breaker.call(
+                lambda: self.elastic.close_point_in_time(body={'id': pit}))
+        except NotFoundError:
+            pass
+
+    async def scan(self,
+                   index: str,
+                   source: list[str] = None,
+                   size: int = None) -> AsyncIterator[list[dict]]:
+        """
+        Обходит весь индекс пачками по `size` документов (только поля
+        `source`) через point-in-time и search_after. В памяти одна пачка:
+        следующая запрашивается, когда предыдущую забрали.
+        """
+        size = size or ES_MAX_SIZE
+        pit = await self.open_pit(index)
+        after = None
+        try:
+            while True:
+                params = {'search_after': after} if after else {}
+                with metrics.timer('es_scan', index):
+                    docs = await self.breaker.call(
+                        lambda: self.elastic.search(
+                            pit={'id': pit,
+                                 'keep_alive':
+                                     settings.PAGINATION_PIT_KEEP_ALIVE},
+                            size=size,
+                            # Самый дешёвый порядок обхода внутри PIT
+                            sort=[{'_shard_doc': 'asc'}],
+                            _source_includes=source,
+                            **params))
+                hits = docs['hits']['hits']
+                pit = docs.get('pit_id', pit)
+                if hits:
+                    yield [hit['_source'] for hit in hits]
+                if len(hits) < size:
+                    return
+                after = hits[-1]['sort']
+        finally:
+            await self.close_pit(pit)
+
+    def _to_page(self, docs: dict) -> Page:
+        hits = docs['hits']['hits']
+        return Page((self.model(**doc['_source']) for doc in hits),
+                    after=hits[-1].get('sort') if hits else None,
+                    pit_id=docs.get('pit_id'))
+
+    async def _get_many_from_elastic(self,
+                                     index: str,
+                                     searches: list[dict],
+                                     sort: str = None,
+                                     page: int = None,
+                                     size: int = None) -> list[Optional]:
+        sorting = _get_sorting(sort)
+        offset, size = _get_offset(page, size)
+
+        body = []
+        for search in searches:
+            request = {'query': search,
+                       'size': size,
+                       'sort': sorting,
+                       'from': offset,
+                       '_source': self.source}
+            body.extend([{'index': index},
+                         {k: v for k, v in request.items() if v is not None}])
+
+        try:
+            with metrics.timer('es_msearch', index):
+                docs = await self.breaker.call(
+                    lambda: self.elastic.msearch(body=body))
+        except NotFoundError:
+            return [None] * len(searches)
+
+        # Ответы msearch приходят в том же порядке, что и запросы
+        return [self._to_page(res) if 'error' not in res else None
+                for res in docs['responses']]
+
+    async def _probe(self, name: str, index: str) -> Optional:
+        load_shedding.detach()
+        return await self._get_from_cache(name, index)
+
+    async def _get_from_cache(self, name: str = None,
+                              index: str = '') -> Optional:
+        load_shedding.check()
+        try:
+            with metrics.timer('redis_get', index):
+                data = await self.redis.get(name)
+        except ResponseError:
+            # Старый формат (hash) - считаем промахом, SET перезапишет ключ
             return None
 
-        res = [self.model.parse_raw(i) for i in data.values()]
-        return res
+        with metrics.timer('decode', index):
+            return self._decode(data)
+
+    async def _get_many_from_cache(self, names: list[str],
+                                   index: str = '') -> list[tuple]:
+        # Пары (страница, устарела ли она по мягкому TTL)
+        with metrics.timer('redis_get', index):
+            data = await _get_with_ttl(self.redis, names)
+
+        with metrics.timer('decode', index):
+            pages = [self._decode(item) for item, _ in data]
+        # Короткоживущие страницы заранее не обновляем, они и так истекут
+        return [(page, page is not None and self.ttl is None and
+                 _is_stale(index, ttl))
+                for page, (_, ttl) in zip(pages, data)]
+
+    async def _put_to_cache(self, key: str, entities: list, index: str = ''):
+        await self._put_many_to_cache({key: entities}, index)
+
+    async def _put_many_to_cache(self, entities_by_key: dict[str, list],
+                                 index: str = ''):
+        if not entities_by_key:
+            return
+        ttl = self.ttl or _cache_ttl(index)
+        with metrics.timer('redis_set', index):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, entities in entities_by_key.items():
+                    pipe.set(key, self._encode(entities), ttl)
+                    # По тегам страница сбрасывается при изменении
+                    # любого её документа
+                    invalidation.tag(pipe, key, invalidation.tags(
+                        index, [entity.id for entity in entities], lists=True),
+                        ttl)
+                await pipe.execute()
+
+    def _encode(self, entities: list) -> bytes:
+        # Вся страница одной записью, порядок элементов как в ответе ES
+        return self.codec.dumps(
+            {'items': [entity.dict() for entity in entities],
+             'after': getattr(entities, 'after', None)})
+
+    def _decode(self, data) -> Optional:
+        if not data or isinstance(data, ResponseError):
+            return None
+        value = _loads(data)
+        if value is None:
+            return None
+        if isinstance(value, list):
+            # Запись без курсора, сохранённая до появления search_after
+            value = {'items': value}
+        return Page((self.model(**item) for item in value['items']),
+                    after=value.get('after'))
+
+
+def _touch(index: str, entities: list = None):
+    # Ответ со страницей списка зависит и от её документов, и от состава
+    # списков индекса
+    if entities:
+        invalidation.touch(index, [entity.id for entity in entities],
+                           lists=True)
+
+
+def _track(service):
+    # Счётчики single-flight и L1 попадают в /metrics, например
+    # под именем ListService.FilmShort
+    name = f'{type(service).__name__}.{service.model.__name__}'
+    metrics.stats_collector.track('single_flight', name, service.flight)
+    metrics.stats_collector.track('memory_cache', name, service.l1)
+
+
+def _get_sorting(sort: str = None) -> list:
+    # id в конце сортировки делает порядок однозначным, без этого
+    # search_after может пропускать или повторять документы
+    tiebreaker = {'id': {'order': 'asc'}}
+    if not sort:
+        return ['_score', tiebreaker]
+    try:
+        order = 'desc' if sort.startswith('-') else 'asc'
+        sort = sort[1:] if sort.startswith('-') else sort
+        return [{sort: {'order': order}}, tiebreaker]
+    except AttributeError:
+        return ['_score', tiebreaker]
+
 
-    async def _put_to_cache(self, key: str, entities: list):
-        entities_dict: dict =\
-            {item: entity.json() for item, entity in enumerate(entities)}
-        await self.redis.hset(name=key, mapping=entities_dict)
-        await self.redis.expire(name=key, time=CACHE_EXPIRE_IN_SECONDS)
+def _get_offset(page: int = None, size: int = None) -> tuple[int | None, int]:
+    if page and size:
+        offset = (page * size) - size
+    elif page and not size:
+        size = ES_MAX_SIZE
+        offset = (page * size) - size
+    elif not page and size:
+        offset = None
+    else:
+        offset = None
+        size = ES_MAX_SIZE
+    return offset, size
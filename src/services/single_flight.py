@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Снимаем блокировку, только если она всё ещё наша
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные промахи кеша по одному ключу: в Elasticsearch
+    идёт только одна корутина, остальные ждут её результат.
+    В режиме `redis` то же самое делается между воркерами через блокировку
+    в Redis: кто не взял блокировку, ждёт, пока кеш заполнит другой воркер.
+    """
+    def __init__(self,
+                 redis: Redis,
+                 mode: str = 'local',
+                 lock_timeout: int = 5000,
+                 poll_interval: int = 50):
+        self.redis = redis
+        self.mode = mode
+        # Время жизни блокировки и интервал опроса кеша в миллисекундах
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.stats = Counter()
+        self._calls: dict[str, asyncio.Task] = {}
+        # Ссылки на фоновые обновления, чтобы их не собрал GC
+        self._background: set[asyncio.Task] = set()
+
+    async def do(self,
+                 key: str,
+                 fetch: Callable[[], Awaitable],
+                 probe: Callable[[], Awaitable] = None) -> Optional:
+        task = self._calls.get(key)
+        if task:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(task)
+
+        self.stats['flights'] += 1
+        if self.mode == 'redis' and probe:
+            task = asyncio.ensure_future(self._locked(key, fetch, probe))
+        else:
+            task = asyncio.ensure_future(fetch())
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        # shield: отмена запроса-лидера не должна отменять загрузку для
+        # остальных ожидающих
+        return await asyncio.shield(task)
+
+    def refresh(self,
+                key: str,
+                fetch: Callable[[], Awaitable],
+                probe: Callable[[], Awaitable] = None):
+        # Обновление в фоне; если по ключу уже идёт запрос, второй не нужен
+        if key in self._calls:
+            return
+        self.stats['refreshes'] += 1
+        task = asyncio.ensure_future(self.do(key, fetch, probe))
+        self._background.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            self.stats['refresh_errors'] += 1
+            logger.warning('Background cache refresh failed',
+                           exc_info=task.exception())
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Помечаем исключение как полученное, даже если лидер отменён
+            task.exception()
+
+    async def _locked(self,
+                      key: str,
+                      fetch: Callable[[], Awaitable],
+                      probe: Callable[[], Awaitable]) -> Optional:
+        lock = f'lock:{key}'
+        token = uuid.uuid4().hex
+        if await self.redis.set(lock, token, nx=True, px=self.lock_timeout):
+            try:
+                return await fetch()
+            finally:
+                await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock, token)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout / 1000
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval / 1000)
+            res = await probe()
+            if res:
+                self.stats['coalesced_remote'] += 1
+                return res
+            if not await self.redis.exists(lock):
+                break
+
+        # Блокировка снята или протухла, а кеш так и не заполнен
+        self.stats['lock_fallback'] += 1
+        return await fetch()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import urlencode, urlsplit
+
+import orjson
+
+from core.config import settings
+from db import redis
+
+logger = logging.getLogger(__name__)
+
+HOT_PATHS_KEY = 'warmup:hot'
+# Популярные пути считаются по часам: новые пути каждый час начинают
+# на равных, а вклад старых часов в общий рейтинг убывает вдвое за час
+HOT_PATHS_WINDOW = 60 * 60
+HOT_PATHS_DECAY = 0.5
+LOCK_KEY = 'warmup:lock'
+LOCK_TTL = 60
+FILM_SORTS = (None, 'imdb_rating', '-imdb_rating')
+# Отмечает запросы прогрева, чтобы не записывать их в популярные
+SCOPE_KEY = 'warmup'
+
+
+async def _get(app, path: str) -> tuple[int, bytes]:
+    # Запрос прямо в ASGI-приложение, без сети и HTTP-клиента
+    url = urlsplit(path)
+    scope = {'type': 'http',
+             'asgi': {'version': '3.0'},
+             'http_version': '1.1',
+             'method': 'GET',
+             'scheme': 'http',
+             'path': url.path,
+             'raw_path': url.path.encode(),
+             'query_string': url.query.encode(),
+             'root_path': '',
+             'headers': [(b'host', b'warmup')],
+             'server': ('warmup', 80),
+             'client': None,
+             SCOPE_KEY: True}
+    response = {'status': None, 'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = int(message['status'])
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    return response['status'], response['body']
+
+
+def _films_path(**params) -> str:
+    query = urlencode({k: v for k, v in params.items() if v is not None})
+    return f'/api/v1/films/?{query}' if query else '/api/v1/films/'
+
+
+async def _json(app, path: str) -> list:
+    status, body = await _get(app, path)
+    return orjson.loads(body) if status == 200 else []
+
+
+def _window_key(age: int = 0) -> str:
+    # warmup:hot:<номер часа>; age - сколько часов назад
+    return f'{HOT_PATHS_KEY}:{int(time.time() // HOT_PATHS_WINDOW) - age}'
+
+
+async def hot_paths(limit: int) -> list[str]:
+    if not limit:
+        return []
+    weights = {_window_key(age): HOT_PATHS_DECAY ** age
+               for age in range(settings.WARMUP_HOT_WINDOWS)}
+    async with redis.redis.pipeline(transaction=False) as pipe:
+        pipe.zunionstore(HOT_PATHS_KEY, weights)
+        pipe.expire(HOT_PATHS_KEY, HOT_PATHS_WINDOW)
+        pipe.zrevrange(HOT_PATHS_KEY, 0, limit - 1)
+        *_, paths = await pipe.execute()
+    return [path.decode() for path in paths]
+
+
+async def build_paths(app) -> list[str]:
+    """
+    Что прогревать: пути из настроек, первые страницы фильмов для каждой
+    сортировки и жанра, самые рейтинговые фильмы и записанные популярные
+    запросы. Жанры и так лежат в памяти воркера.
+    """
+    genres = await _json(app, '/api/v1/genres/')
+    paths = list(settings.WARMUP_PATHS)
+    for sort in FILM_SORTS:
+        for genre in [None, *(genre['uuid'] for genre in genres)]:
+            for page in range(1, settings.WARMUP_PAGES + 1):
+                paths.append(_films_path(sort=sort, genre=genre,
+                                         page_number=page))
+
+    if settings.WARMUP_TOP_FILMS:
+        top = await _json(app, _films_path(
+            sort='-imdb_rating', page_size=settings.WARMUP_TOP_FILMS))
+        paths.extend(f'/api/v1/films/{film["uuid"]}' for film in top)
+
+    paths.extend(await hot_paths(settings.WARMUP_HOT_PATHS))
+    return list(dict.fromkeys(paths))
+
+
+async def warm_up(app) -> dict[int, int]:
+    # Не больше WARMUP_CONCURRENCY запросов одновременно, чтобы не
+    # перегрузить ES сразу после деплоя
+    semaphore = asyncio.Semaphore(settings.WARMUP_CONCURRENCY)
+    statuses = {}
+
+    async def fetch(path: str):
+        async with semaphore:
+            try:
+                status, _ = await _get(app, path)
+            except Exception:
+                logger.warning('Warm-up request %s failed', path,
+                               exc_info=True)
+                status = 500
+            statuses[status] = statuses.get(status, 0) + 1
+
+    paths = await build_paths(app)
+    await asyncio.gather(*(fetch(path) for path in paths))
+    logger.info('Cache warm-up finished: %s requests, statuses %s',
+                len(paths), statuses)
+    return statuses
+
+
+async def warm_up_once(app) -> dict[int, int] | None:
+    # Прогрев запускают все воркеры, а выполняет тот, кто первым взял
+    # блокировку: остальным хватит уже заполненного Redis
+    if not await redis.redis.set(LOCK_KEY, os.getpid(), nx=True, ex=LOCK_TTL):
+        return None
+    return await warm_up(app)
+
+
+class HotPathMiddleware:
+    """
+    Записывает в Redis долю успешных GET-запросов, чтобы при следующем
+    запуске прогреть то, что реально запрашивают.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'GET' or \
+                not scope['path'].startswith('/api/v1/') or \
+                scope.get(SCOPE_KEY) or not settings.WARMUP_HOT_PATHS or \
+                random.random() >= settings.WARMUP_RECORD_RATE:
+            return await self.app(scope, receive, send)
+
+        status = {'code': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                # Прогревать имеет смысл только JSON-ответы, не выгрузки
+                json = dict(message['headers']).get(b'content-type') == \
+                    b'application/json'
+                status['code'] = message['status'] if json else None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if status['code'] == 200:
+            await self._record(scope)
+
+    @staticmethod
+    async def _record(scope):
+        path = scope['path']
+        if scope['query_string']:
+            path = f'{path}?{scope["query_string"].decode()}'
+        key = _window_key()
+        try:
+            async with redis.redis.pipeline(transaction=False) as pipe:
+                pipe.zincrby(key, 1, path)
+                # Храним с запасом, но не бесконечно
+                limit = settings.WARMUP_HOT_PATHS * 10
+                pipe.zremrangebyrank(key, 0, -limit - 1)
+                pipe.expire(key,
+                            HOT_PATHS_WINDOW * settings.WARMUP_HOT_WINDOWS)
+                await pipe.execute()
+        except Exception:
+            logger.debug('Hot path is not recorded', exc_info=True)
@@ -0,0 +1,13 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / 'src'), str(ROOT)]
+
+# Настройки сервиса обязательны, но тесты ни к чему не подключаются
+for name, value in {'PROJECT_NAME': 'tests',
+                    'REDIS_HOST': 'localhost', 'REDIS_PORT': '6379',
+                    'ELASTIC_HOST': 'localhost', 'ELASTIC_PORT': '9200',
+                    'HOST': '127.0.0.1', 'PORT': '8000'}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,73 @@
+from models.films import Film, FilmShort
+from services import cache_keys
+
+
+def test_normalize_collapses_whitespace():
+    assert cache_keys.normalize('  star   wars\t') == 'star wars'
+    assert cache_keys.normalize('star wars') == \
+        cache_keys.normalize(' star  wars ')
+
+
+def test_normalize_drops_empty_values():
+    assert cache_keys.normalize(None) is None
+    assert cache_keys.normalize('') is None
+    assert cache_keys.normalize('   ') is None
+
+
+def test_normalize_scalars():
+    assert cache_keys.normalize(5) == '5'
+    assert cache_keys.normalize(True) == 'true'
+    assert cache_keys.normalize([1, 'a']) == '[1,"a"]'
+
+
+def test_normalize_hashes_separator_and_marker():
+    for value in ('a:b', '#abc'):
+        res = cache_keys.normalize(value)
+        assert res.startswith('#')
+        assert ':' not in res
+        assert res != value
+    # Захешированное значение не совпадает с самим хешем
+    hashed = cache_keys.normalize('a:b')
+    assert cache_keys.normalize(hashed) != hashed
+
+
+def test_normalize_hashes_long_values():
+    value = 'x' * (cache_keys.MAX_VALUE_LENGTH + 1)
+    res = cache_keys.normalize(value)
+    assert res.startswith('#')
+    assert len(res) < len(value)
+    assert cache_keys.normalize('x' * cache_keys.MAX_VALUE_LENGTH) == \
+        'x' * cache_keys.MAX_VALUE_LENGTH
+    assert res != cache_keys.normalize(value + 'y')
+
+
+def test_list_key_ignores_parameter_order():
+    params = {'sort': '-imdb_rating', 'page': 1, 'size': 50, 'genre': None}
+    assert cache_keys.list_key('movies', FilmShort, params) == \
+        cache_keys.list_key('movies', FilmShort,
+                            dict(reversed(params.items())))
+    assert cache_keys.list_key('movies', FilmShort, params) == \
+        cache_keys.list_key('movies', FilmShort,
+                            {'size': 50, 'page': 1, 'sort': '-imdb_rating'})
+
+
+def test_list_key_separates_parameters():
+    # Значение с разделителем не может изобразить другой параметр
+    assert cache_keys.list_key('movies', FilmShort, {'a': 'b:c:d'}) != \
+        cache_keys.list_key('movies', FilmShort, {'a': 'b', 'c': 'd'})
+    assert cache_keys.list_key('movies', FilmShort, {'page': 1}) != \
+        cache_keys.list_key('movies', FilmShort, {'page': 2})
+
+
+def test_entity_key_differs_across_index_and_model():
+    keys = {cache_keys.entity_key('movies', Film, '1'),
+            cache_keys.entity_key('movies', FilmShort, '1'),
+            cache_keys.entity_key('persons', Film, '1')}
+    assert len(keys) == 3
+    assert cache_keys.entity_key('movies', Film, '1') != \
+        cache_keys.entity_key('movies', Film, '2')
+
+
+def test_list_and_entity_keys_do_not_collide():
+    assert cache_keys.entity_key('movies', FilmShort, '1') != \
+        cache_keys.list_key('movies', FilmShort, {'id': '1'})
@@ -0,0 +1,56 @@
+import zlib
+
+import orjson
+import pytest
+
+from services import codec
+from services.codec import COMPRESSORS, SERIALIZERS, Codec
+
+VALUE = {'id': '1', 'title': 'Star Wars', 'imdb_rating': 8.6,
+         'genre': [{'id': 'g', 'name': 'Sci-Fi'}] * 50}
+INSTALLED = [(serializer, compression)
+             for serializer in SERIALIZERS for compression in COMPRESSORS
+             if SERIALIZERS[serializer][3] and COMPRESSORS[compression][3]]
+
+
+@pytest.mark.parametrize('serializer,compression', INSTALLED)
+@pytest.mark.parametrize('threshold', [0, 1, 10 ** 6])
+def test_round_trip(serializer, compression, threshold):
+    data = Codec(serializer, compression, threshold).dumps(VALUE)
+    assert data[:1] == codec.VERSION
+    assert Codec.loads(data) == VALUE
+
+
+def test_compresses_only_from_threshold():
+    small = Codec('orjson', 'zlib', 10 ** 6).dumps(VALUE)
+    large = Codec('orjson', 'zlib', 1).dumps(VALUE)
+    assert small[2:3] == COMPRESSORS['none'][0]
+    assert large[2:3] == COMPRESSORS['zlib'][0]
+    assert len(large) < len(small)
+
+
+def test_loads_any_format_regardless_of_settings():
+    data = Codec('msgpack', 'zlib', 1).dumps(VALUE)
+    assert Codec('orjson', 'none').loads(data) == VALUE
+
+
+def test_loads_legacy_entries():
+    payload = orjson.dumps(VALUE)
+    assert Codec.loads(payload) == VALUE
+    assert Codec.loads(codec.LEGACY_PLAIN + payload) == VALUE
+    assert Codec.loads(codec.LEGACY_COMPRESSED + zlib.compress(payload)) \
+        == VALUE
+
+
+@pytest.mark.parametrize('data', [b'x{}', codec.VERSION + b'?-{}',
+                                  codec.VERSION + b'j?{}'])
+def test_loads_rejects_unknown_format(data):
+    with pytest.raises(ValueError):
+        Codec.loads(data)
+
+
+def test_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        Codec('pickle')
+    with pytest.raises(ValueError):
+        Codec('orjson', 'bzip2')